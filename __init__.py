@@ -26,275 +26,1751 @@ bl_info = {
 
 ''' TODO
     # hard : Manage ESC during other modal ?
-    # hard (optional) :  one big undo instead of multi undo ? (how to cancel other ops undo stack during modal...)
+    # hard (optional) :  one big undo instead of multi undo ? (lattice edit still push its own steps, modal ctrl+Z use cage history)
 
-    # optional : option to reproject once finished
-        # maybe with a modifier key
-
-    # add option to place lattice according to object transform instead of view (no real need if stay GP only)
-    
     # make a generic mesh handling (and add another shortcut for Mesh  edit)
     
     # whats the most proper way to add addon keymaps and expose to customisation in addon prefs...
-    #  if in obj mode, consider all points (or even just get bbox if in object + local axis mode)
 '''   
 
 import bpy
+import os
+import json
+import time
 import numpy as np
-
-
-def location_to_region(worldcoords):
-    from bpy_extras import view3d_utils
-    return view3d_utils.location_3d_to_region_2d(bpy.context.region, bpy.context.space_data.region_3d, worldcoords)
-
-def region_to_location(viewcoords, depthcoords):
-    from bpy_extras import view3d_utils
-    return view3d_utils.region_2d_to_location_3d(bpy.context.region, bpy.context.space_data.region_3d, viewcoords, depthcoords)
-
-def assign_vg(obj, vg_name):
-    ## create vertex group
-    vg = obj.vertex_groups.get(vg_name)
-    if vg:
-        # remove to start clean
-        obj.vertex_groups.remove(vg)
-    vg = obj.vertex_groups.new(name=vg_name)
-    bpy.ops.gpencil.vertex_group_assign()
-    return vg
-
-def view_cage(obj):
-
-    lattice_interp = get_addon_prefs().default_deform_type
-
+from collections import deque, OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from mathutils import Matrix
+
+
+def project_to_region(persp_mat, width, height, co):
+    '''Project (n, 3) world coordinates to (n, 2) region coordinates in one pass
+    persp_mat : region_3d.perspective_matrix
+    width, height : region size in pixels
+    Points behind the view are dropped (location_3d_to_region_2d return None for those)
+    '''
+    mat = np.array(persp_mat, dtype=np.float64)
+    prj = co @ mat[:, :3].T + mat[:, 3]# (n, 4) clip coordinates
+    prj = prj[prj[:, 3] > 0.0]
+    half = np.array((width / 2.0, height / 2.0))
+    return half + half * (prj[:, :2] / prj[:, 3:])
+
+def region_to_world(persp_mat, width, height, coords2d, depth_co):
+    '''Unproject (n, 2) region coordinates to (n, 3) world coordinates in one pass
+    Points are placed on the plane facing the view passing through depth_co
+    (same result as region_2d_to_location_3d for ortho and perspective views)
+    '''
+    mat = np.array(persp_mat, dtype=np.float64)
+    depth = mat @ np.append(np.asarray(depth_co, dtype=np.float64), 1.0)
+    half = np.array((width / 2.0, height / 2.0))
+    ndc = np.empty((len(coords2d), 4))
+    ndc[:, :2] = np.asarray(coords2d, dtype=np.float64) / half - 1.0
+    ndc[:, 2] = depth[2] / depth[3]
+    ndc[:, 3] = 1.0
+    world = ndc @ np.linalg.inv(mat).T
+    return world[:, :3] / world[:, 3:]
+
+def project_on_plane(co, origin, normal, ray_origin=None, ray_dir=None):
+    '''Cast (n, 3) world coordinates on a plane along view rays in one pass
+    ray_origin : view location for perspective view (rays from it through each point)
+    ray_dir : view direction for orthographic view (parallel rays)
+    Points with a ray parallel to the plane stay in place
+    '''
+    normal = np.asarray(normal, dtype=np.float64)
+    if ray_origin is not None:
+        dirs = co - np.asarray(ray_origin, dtype=np.float64)
+    else:
+        dirs = np.broadcast_to(np.asarray(ray_dir, dtype=np.float64), co.shape)
+    denom = dirs @ normal
+    t = np.divide((np.asarray(origin, dtype=np.float64) - co) @ normal, denom,
+        out=np.zeros(len(co)), where=np.abs(denom) > 1e-8)
+    return co + dirs * t[:, None]
+
+def drawing_plane(obj, scene, r3d):
+    '''Return (origin, normal, ray_origin, ray_dir) to cast points of a GP object on its drawing plane
+    Plane from tool settings : stroke placement (origin or cursor) and drawing plane axis
+    Rays follow the view of passed region_3d
+    '''
+    ts = scene.tool_settings
+    origin = scene.cursor.location if ts.gpencil_stroke_placement_view3d == 'CURSOR' else obj.matrix_world.translation
+    axis = ts.gpencil_sculpt.lock_axis
+    if axis == 'VIEW':
+        normal = r3d.view_rotation @ Matrix.Identity(3).col[2]
+    elif axis == 'CURSOR':
+        normal = scene.cursor.matrix.to_3x3() @ Matrix.Identity(3).col[2]
+    else:
+        # front (X-Z), side (Y-Z) and top (X-Y) planes follow object rotation
+        normal = obj.matrix_world.to_3x3() @ Matrix.Identity(3).col['XYZ'.index(axis[-1])]
+
+    view_inv = r3d.view_matrix.inverted()
+    if r3d.is_perspective:
+        return np.array(origin), np.array(normal), np.array(view_inv.translation), None
+    return np.array(origin), np.array(normal), None, -np.array(view_inv.col[2][:3])
+
+def reproject_targets(targets, co, plane):
+    '''Cast targeted points of (n, 3) object space coordinates on a drawing plane (in place)'''
+    mat = np.array(targets.obj.matrix_world, dtype=np.float64)
+    world = co[targets.mask] @ mat[:3, :3].T + mat[:3, 3]
+    world = project_on_plane(world, *plane)
+    co[targets.mask] = ((world - mat[:3, 3]) @ np.linalg.inv(mat[:3, :3]).T).astype(np.float32)
+    return co
+
+def get_stroke_co(s):
+    '''Return stroke points coordinates as a (n, 3) float32 array'''
+    co = np.empty(len(s.points) * 3, dtype=np.float32)
+    s.points.foreach_get('co', co)
+    return co.reshape(-1, 3)
+
+def get_stroke_select(s):
+    '''Return stroke points selection state as a (n,) bool array'''
+    sel = np.empty(len(s.points), dtype=bool)
+    s.points.foreach_get('select', sel)
+    return sel
+
+def apply_matrix(mat, co):
+    '''Apply a 4x4 matrix to a (n, 3) array of coordinates in one product'''
+    mat = np.array(mat, dtype=np.float32)
+    return co @ mat[:3, :3].T + mat[:3, 3]
+
+class GPTargets:
+    '''Strokes of a GP object touched by the deformation
+    co     : (n, 3) float32 object space coordinates of all points of those strokes
+    mask   : (n,) bool, points to deform
+    counts : point count of each stroke (to slice co per stroke)
+    keys   : (layer index, frame number, stroke index) of each stroke
+    bounds : (2, s, 3) min and max of each stroke when points are read lazily
+        (object mode, the cage is fitted on strokes bounds and points are read on first deform)
+    stroke_bounds : (2, s, 3) bounds of each stroke when gathered (2.91+), with frame_sizes
+        (strokes count of each (layer index, frame number)) tell if a stroke changed since
+    dirty : (s,) bool, strokes whose written points differ from original positions (None : none)
+    touched : (s,) bool, strokes written since last restore (None : none),
+        only those need a geometry refresh or a write back on cancel
+    '''
+
+    def __init__(self, obj, mode='OBJECT'):
+        self.obj = obj
+        self.mode = mode# gather mode, other frames are targeted the same way when propagating
+        self.strokes = []
+        self.keys = []
+        self.counts = np.empty(0, dtype=np.intp)
+        self.bounds = None
+        self.stroke_bounds = None
+        self.frame_sizes = {}
+        self.cache_state = None# set when kept in gather_cache
+        self.dirty = None
+        self.touched = None
+        self._co = np.empty((0, 3), dtype=np.float32)
+        self._mask = np.empty(0, dtype=bool)
+
+    def __len__(self):
+        if self._mask is None:
+            return int(self.counts.sum())
+        return int(np.count_nonzero(self._mask))
+
+    @property
+    def loaded(self):
+        return self._co is not None
+
+    @property
+    def co(self):
+        if self._co is None:
+            self.load()
+        return self._co
+
+    @co.setter
+    def co(self, value):
+        self._co = value
+
+    @property
+    def mask(self):
+        if self._mask is None:
+            self.load()
+        return self._mask
+
+    @mask.setter
+    def mask(self, value):
+        self._mask = value
+
+    def set_points(self, cos, masks):
+        '''Stack (n, 3) coordinates and (n,) masks of each stroke'''
+        if cos:
+            self.counts = np.array([len(co) for co in cos], dtype=np.intp)
+            self.co = np.concatenate(cos)
+            self.mask = np.concatenate(masks)
+
+    def load(self):
+        '''Read points of all strokes (deferred for targets gathered with bounds only)'''
+        cos = [get_stroke_co(s) for s in self.strokes]
+        self._co = np.concatenate(cos) if cos else np.empty((0, 3), dtype=np.float32)
+        self._mask = np.ones(len(self._co), dtype=bool)
+
+    @property
+    def nbytes(self):
+        '''Memory held by original points arrays'''
+        return sum(a.nbytes for a in (self._co, self._mask) if a is not None)
+
+    @property
+    def touched_indices(self):
+        return np.empty(0, dtype=np.intp) if self.touched is None else np.flatnonzero(self.touched)
+
+    def stroke_table(self):
+        '''Return {stroke key: (original coordinates, bounds, frame strokes count)} to reuse
+        points of unchanged strokes in a new gathering (empty if points or bounds were never read)
+        '''
+        if self.stroke_bounds is None or not self.loaded:
+            return {}
+        bounds = np.concatenate(([0], np.cumsum(self.counts)))
+        return {key: (self.co[bounds[i]:bounds[i+1]], self.stroke_bounds[:, i], self.frame_sizes[key[:2]])
+            for i, key in enumerate(self.keys)}
+
+    def expire_touched(self):
+        '''Written strokes don't hold original positions anymore, never reuse them'''
+        if self.stroke_bounds is not None and self.touched is not None:
+            self.stroke_bounds[:, self.touched] = np.nan
+
+    def touched_subset(self):
+        '''Return a GPTargets of touched strokes only, with their original coordinates
+        (enough to write them back), all flagged touched
+        '''
+        indices = self.touched_indices
+        bounds = np.concatenate(([0], np.cumsum(self.counts)))
+        subset = GPTargets(self.obj, self.mode)
+        subset.strokes = [self.strokes[i] for i in indices]
+        subset.keys = [self.keys[i] for i in indices]
+        subset.set_points([self.co[bounds[i]:bounds[i+1]] for i in indices],
+            [np.ones(self.counts[i], dtype=bool) for i in indices])
+        subset.touched = np.ones(len(indices), dtype=bool)
+        return subset
+
+    def pending(self, co):
+        '''Return indices of strokes to write for (n, 3) coordinates co
+        (points moved from original positions, or moved back to them since last write)
+        '''
+        stroke_ids = np.repeat(np.arange(len(self.counts)), self.counts)
+        moved = np.zeros(len(self.counts), dtype=bool)
+        moved[stroke_ids[np.any(co != self.co, axis=1)]] = True
+        write = moved if self.dirty is None else moved | self.dirty
+        self.dirty = moved
+        self.touched = write if self.touched is None else self.touched | write
+        return np.flatnonzero(write)
+
+    def fit_co(self):
+        '''Object space coordinates to fit the cage on (strokes bounds corners if available)'''
+        if self.bounds is not None:
+            return bounds_corners(*self.bounds)
+        return self.points
+
+    @property
+    def points(self):
+        '''object space coordinates of points to deform'''
+        return self.co[self.mask]
+
+    @property
+    def frame_count(self):
+        '''number of distinct frames touched (more than one in multiframe edit)'''
+        return len({key[:2] for key in self.keys})
+
+    def resolve(self, obj):
+        '''Fetch stroke references again from keys (needed after an undo
+        since previous references are invalid), return False if data changed
+        '''
+        layers = obj.data.layers
+        frames_strokes = {}
+        strokes = []
+        for (li, fnum, si), ct in zip(self.keys, self.counts):
+            fstrokes = frames_strokes.get((li, fnum))
+            if fstrokes is None:
+                if li >= len(layers):
+                    return False
+                frame = next((f for f in layers[li].frames if f.frame_number == fnum), None)
+                if frame is None:
+                    return False
+                fstrokes = frames_strokes[(li, fnum)] = frame.strokes[:]
+            if si >= len(fstrokes) or len(fstrokes[si].points) != ct:
+                return False
+            strokes.append(fstrokes[si])
+        self.obj = obj
+        self.strokes = strokes
+        # undo restored original positions
+        self.dirty = self.touched = None
+        return True
+
+def has_stroke_bounds():
+    return bpy.types.GPencilStroke.bl_rna.properties.get('bound_box_min') is not None# 2.91+
+
+def stroke_co(s, key, count, bounds, frame_size, previous):
+    '''Return stroke coordinates, taken from a previous gathering (see GPTargets.stroke_table)
+    if the stroke did not change (same frame strokes count, points count and bounds), else read
+    '''
+    prev = previous.get(key)
+    if prev is not None and bounds is not None and prev[2] == frame_size \
+            and len(prev[0]) == count and np.array_equal(prev[1], bounds):
+        return prev[0]
+    return get_stroke_co(s)
+
+def gather_selected(targets, cos, masks, bounds, layer_index, frame, previous=None):
+    '''Add selected strokes of a frame to targets, with their coordinates, selected points masks
+    and bounds (if available), coordinates of strokes unchanged since previous gathering are reused
+    '''
+    previous = previous or {}
+    strokes = frame.strokes
+    frame_size = len(strokes)
+    targets.frame_sizes[(layer_index, frame.frame_number)] = frame_size
+    # strokes selection and bounds in one call, unselected strokes are never accessed
+    stroke_sel = np.empty(frame_size, dtype=bool)
+    strokes.foreach_get('select', stroke_sel)
+    frame_bounds = get_strokes_bounds(strokes) if has_stroke_bounds() else None
+    for si in np.flatnonzero(stroke_sel).tolist():
+        s = strokes[si]
+        sel = get_stroke_select(s)
+        if sel.any():
+            key = (layer_index, frame.frame_number, si)
+            stroke_bounds = frame_bounds[:, si] if frame_bounds is not None else None
+            targets.strokes.append(s)
+            targets.keys.append(key)
+            cos.append(stroke_co(s, key, len(sel), stroke_bounds, frame_size, previous))
+            masks.append(sel)
+            if stroke_bounds is not None:
+                bounds.append(stroke_bounds)
+
+def paint_stroke_index(strokes):
+    '''Index of the stroke drawn last (first one when drawing on back)'''
+    if bpy.context.scene.tool_settings.use_gpencil_draw_onback:
+        return 0
+    return len(strokes) - 1
+
+def gather_targets(obj, mode, previous=None):
+    '''Return a GPTargets of points to deform in passed mode (or an error string)
+    previous : GPTargets of a previous gathering, points of strokes that did not change are not read again
+    '''
     gp = obj.data
     gpl = gp.layers
+    targets = GPTargets(obj, mode)
+    cos, masks, bounds = [], [], []
+    table = previous.stroke_table() if previous is not None else {}
 
-    coords = []
-    initial_mode = bpy.context.mode
-
-    ## get points
-    if bpy.context.mode == 'EDIT_GPENCIL':
-        for l in gpl:
+    if mode == 'EDIT_GPENCIL':
+        for li, l in enumerate(gpl):
             if l.lock or l.hide or not l.active_frame:#or len(l.frames)
                 continue
             if gp.use_multiedit:
                 target_frames = [f for f in l.frames if f.select]
             else:
                 target_frames = [l.active_frame]
-            
+
             for f in target_frames:
-                for s in f.strokes:
-                    if not s.select:
-                        continue
-                    for p in s.points:
-                        if p.select:
-                            # get real location
-                            coords.append(obj.matrix_world @ p.co)
-
-    elif bpy.context.mode == 'OBJECT':#object mode -> all points
-        for l in gpl:# if l.hide:continue# only visible ? (might break things)
+                gather_selected(targets, cos, masks, bounds, li, f, table)
+        if bounds and len(bounds) == len(targets.strokes):
+            targets.stroke_bounds = np.stack(bounds, axis=1)
+
+    elif mode == 'OBJECT':#object mode -> all points
+        # whole strokes are deformed : fit the cage on strokes bounds (cost depend on strokes count)
+        # and read points only when deforming
+        use_bounds = has_stroke_bounds()
+        for li, l in enumerate(gpl):# if l.hide:continue# only visible ? (might break things)
             if not len(l.frames):
                 continue#skip frameless layer
-            for s in l.active_frame.strokes:
-                for p in s.points:
-                    coords.append(obj.matrix_world @ p.co)
-    
-    elif bpy.context.mode == 'PAINT_GPENCIL':
+            strokes = l.active_frame.strokes
+            fnum = l.active_frame.frame_number
+            targets.frame_sizes[(li, fnum)] = len(strokes)
+            start = len(targets.strokes)
+            targets.strokes.extend(strokes)
+            targets.keys.extend((li, fnum, si) for si in range(len(targets.strokes) - start))
+            if use_bounds:
+                bounds.append(get_strokes_bounds(strokes))
+
+        targets.counts = np.array([len(s.points) for s in targets.strokes], dtype=np.intp)
+        if use_bounds and bounds:
+            targets.stroke_bounds = np.concatenate(bounds, axis=1)
+            # skip empty strokes bounds
+            targets.bounds = targets.stroke_bounds[:, targets.counts > 0]
+            if table:
+                # points were read by a previous session, only read strokes that changed
+                targets.set_points([stroke_co(s, key, ct, targets.stroke_bounds[:, i], targets.frame_sizes[key[:2]], table)
+                    for i, (s, key, ct) in enumerate(zip(targets.strokes, targets.keys, targets.counts))],
+                    [np.ones(ct, dtype=bool) for ct in targets.counts])
+            else:
+                targets.co = targets.mask = None
+        else:
+            targets.load()
+        return targets
+
+    elif mode == 'PAINT_GPENCIL':
         # get last stroke points coordinated
-        if not gpl.active or not gpl.active.active_frame:
+        # target is passed by index : no selection change or vertex group needed,
+        # so cost only depend on the last stroke size
+        frame = gpl.active.active_frame if gpl.active else None
+        if not frame:
             return 'No frame to deform'
 
-        if not len(gpl.active.active_frame.strokes):
+        strokes = frame.strokes
+        stroke_ct = len(strokes)
+        if not stroke_ct:
             return 'No stroke found to deform'
-        
-        paint_id = -1
-        if bpy.context.scene.tool_settings.use_gpencil_draw_onback:
-            paint_id = 0
-        coords = [obj.matrix_world @ p.co for p in gpl.active.active_frame.strokes[paint_id].points]
-    
-    else:
-        return 'Wrong mode!'
-
-    if not coords:
-        ## maybe silent return instead (need special str code to manage errorless return)
-        return 'No points found!'
-
-    if bpy.context.mode in ('EDIT_GPENCIL', 'PAINT_GPENCIL') and len(coords) < 2:
-        # Dont block object mod
-        return 'Less than two point selected'
 
-    vg_name = 'lattice_cage_deform_group'
-
-    if bpy.context.mode == 'EDIT_GPENCIL':
-        vg = assign_vg(obj, vg_name)
-    
-    if bpy.context.mode == 'PAINT_GPENCIL':
-        # points cannot be assign to API yet(ugly and slow workaround but only way)
-        # -> https://developer.blender.org/T56280 so, hop'in'ops !
-        
-        # store selection and deselect all
-        plist = []
-        for s in gpl.active.active_frame.strokes:
-            for p in s.points:
-                plist.append([p, p.select])
-                p.select = False
-        
-        # select
-        ## foreach_set does not update
-        # gpl.active.active_frame.strokes[paint_id].points.foreach_set('select', [True]*len(gpl.active.active_frame.strokes[paint_id].points))
-        for p in gpl.active.active_frame.strokes[paint_id].points:
-            p.select = True
-        
-        # assign
-        bpy.ops.object.mode_set(mode='EDIT_GPENCIL')
-        vg = assign_vg(obj, vg_name)
+        paint_id = paint_stroke_index(strokes)
+        s = strokes[paint_id]
+        targets.strokes.append(s)
+        targets.keys.append((gpl.active_index, frame.frame_number, paint_id))
+        cos.append(get_stroke_co(s))
+        masks.append(np.ones(len(cos[-1]), dtype=bool))
 
-        # restore
-        for pl in plist:
-            pl[0].select = pl[1]
-        
+    else:
+        return 'Wrong mode!'
 
-    ## View axis Mode ---
+    targets.set_points(cos, masks)
+    return targets
+
+## --- Gather cache : repeated invocations don't read strokes again, only the ones that changed
+
+class GatherEntry:
+    '''Last targets gathered on an object
+    state : (data name, mode, scene frame, multiframe) the targets were gathered in
+    stale : GP data was updated since, targets are gathered again reusing points of unchanged strokes
+    trusted : ignore data updates until end_cache_trust runs (positions were just written back
+        by the addon itself, updates of the current event loop iteration come from it)
+    '''
+
+    def __init__(self, state, targets, trusted=False):
+        self.state = state
+        self.targets = targets
+        self.stale = False
+        self.trusted = trusted
+
+## object name : GatherEntry
+gather_cache = {}
+
+def gather_state(obj, mode):
+    return (obj.data.name, mode, bpy.context.scene.frame_current, obj.data.use_multiedit)
+
+def cached_gather(obj, mode):
+    '''Same as gather_targets, reusing last targets of the object if its data did not change since
+    or only points of strokes that did not change (selection edit...)
+    (paint mode is not cached, it only read one stroke)
+    '''
+    if mode not in ('EDIT_GPENCIL', 'OBJECT'):
+        return gather_targets(obj, mode)
+    state = gather_state(obj, mode)
+    entry = gather_cache.get(obj.name)
+    if entry is not None and entry.state == state:
+        if not entry.stale:
+            return entry.targets
+        targets = gather_targets(obj, mode, previous=entry.targets)
+    else:
+        targets = gather_targets(obj, mode)
+    if not isinstance(targets, str):
+        targets.cache_state = state
+        gather_cache[obj.name] = GatherEntry(state, targets)
+    return targets
+
+def recache_targets(targets):
+    '''Put back in cache targets whose original positions were just restored'''
+    state = targets.cache_state
+    if state is not None and state == gather_state(targets.obj, state[1]):
+        gather_cache[targets.obj.name] = GatherEntry(state, targets, trusted=True)
+        if not bpy.app.timers.is_registered(end_cache_trust):
+            # timers run on next event loop iteration, after depsgraph updates of this one
+            bpy.app.timers.register(end_cache_trust, first_interval=0)
+
+def end_cache_trust():
+    '''Data updates from now on don't come from the addon write back'''
+    for entry in gather_cache.values():
+        entry.trusted = False
+
+@bpy.app.handlers.persistent
+def gather_cache_depsgraph_update(scene, depsgraph):
+    '''Flag cached targets of GP data updated since they were gathered'''
+    if not gather_cache:
+        return
+    changed = {u.id.original.name for u in depsgraph.updates if isinstance(u.id, bpy.types.GreasePencil)}
+    if not changed:
+        return
+    for entry in gather_cache.values():
+        # trusted : update triggered by our own write back
+        if entry.state[0] in changed and not entry.trusted:
+            entry.stale = True
+
+@bpy.app.handlers.persistent
+def gather_cache_clear(*args):
+    '''Stroke references are invalid after undo or file load'''
+    gather_cache.clear()
+
+def get_strokes_bounds(strokes):
+    '''Return (2, n, 3) object space bounds min and max of a strokes collection in bulk'''
+    ct = len(strokes)
+    bounds = np.empty((2, ct * 3), dtype=np.float32)
+    strokes.foreach_get('bound_box_min', bounds[0])
+    strokes.foreach_get('bound_box_max', bounds[1])
+    return bounds.reshape(2, ct, 3)
+
+def bounds_corners(bmin, bmax):
+    '''Return (n * 8, 3) corners of boxes from (n, 3) min and max'''
+    corners = np.empty((len(bmin), 8, 3), dtype=bmin.dtype)
+    for i in range(8):
+        corners[:, i] = np.where(np.array((i & 1, i & 2, i & 4), dtype=bool), bmax, bmin)
+    return corners.reshape(-1, 3)
+
+def gather_frame(obj, layer_index, frame, mode='OBJECT'):
+    '''Return a GPTargets of points of one frame, targeted as in passed gather mode
+    (selected points in edit mode, last stroke in paint mode, all points in object mode)
+    '''
+    targets = GPTargets(obj, mode)
+    cos, masks = [], []
+    if mode == 'EDIT_GPENCIL':
+        gather_selected(targets, cos, masks, [], layer_index, frame)
+    elif mode == 'PAINT_GPENCIL':
+        if len(frame.strokes):
+            si = paint_stroke_index(frame.strokes)
+            targets.strokes.append(frame.strokes[si])
+            targets.keys.append((layer_index, frame.frame_number, si))
+            cos.append(get_stroke_co(frame.strokes[si]))
+            masks.append(np.ones(len(cos[-1]), dtype=bool))
+    else:
+        cos = [get_stroke_co(s) for s in frame.strokes]
+        masks = [np.ones(len(co), dtype=bool) for co in cos]
+        targets.strokes = frame.strokes[:]
+        targets.keys = [(layer_index, frame.frame_number, si) for si in range(len(cos))]
+    targets.set_points(cos, masks)
+    return targets
+
+def write_targets(targets, co, indices=None):
+    '''Write back (n, 3) object space coordinates of all targeted strokes with foreach_set
+    indices : only write those strokes (co still hold points of all targeted strokes)
+    '''
+    co = np.ascontiguousarray(co, dtype=np.float32)
+    bounds = np.concatenate(([0], np.cumsum(targets.counts)))
+    for i in range(len(targets.strokes)) if indices is None else indices:
+        targets.strokes[i].points.foreach_set('co', co[bounds[i]:bounds[i+1]].ravel())
+    targets.obj.data.update_tag()
+
+def refresh_strokes(targets):
+    '''Recalculate geometry (triangulation, bounds) of touched strokes only, in one pass
+    (foreach_set on points does not), return refreshed strokes count
+    '''
+    indices = targets.touched_indices
+    if bpy.types.GPencilStrokePoints.bl_rna.functions.get('update') is None:# 2.91+
+        return 0
+    for i in indices:
+        targets.strokes[i].points.update()
+    return len(indices)
+
+
+## --- Timing instrumentation (opt-in from preferences)
+
+## last recorded sessions (oldest first)
+timings = deque(maxlen=100)
+
+class PhaseTimer:
+    '''Accumulate wall-clock duration of box deform phases for one session
+    Disabled timer only cost an attribute check per phase
+    '''
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.phases = {}
+        self.counts = {}
+
+    @contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def count(self, **counts):
+        if self.enabled:
+            self.counts.update(counts)
+
+    def record(self, result):
+        '''Store session timing in history (and log file if set in preferences)'''
+        if not self.enabled:
+            return
+        prefs = get_addon_prefs()
+        rec = {
+            'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'result': result,
+            'counts': dict(self.counts),
+            'phases': dict(self.phases),
+            }
+        timings.append(rec)
+        while len(timings) > prefs.timing_history:
+            timings.popleft()
+
+        if prefs.timing_log:
+            try:
+                with open(bpy.path.abspath(prefs.timing_log), 'a') as fd:
+                    fd.write(json.dumps(rec) + '\n')
+            except OSError as e:
+                print(f'Box deform: cannot write timing log: {e}')
+
+
+## --- Lattice deformation engine (match GP_LATTICE modifier / calc_latt_deform)
+
+def key_curve_weights(t, interp):
+    '''Vectorized key_curve_position_weights from Blender key.c
+    t : (n,) position between control points i and i+1
+    return (n, 4) weights of control points i-1, i, i+1, i+2
+    '''
+    t2 = t * t
+    t3 = t2 * t
+    w = np.zeros((len(t), 4), dtype=t.dtype)
+    if interp == 'KEY_LINEAR':
+        w[:, 1] = 1.0 - t
+        w[:, 2] = t
+    elif interp == 'KEY_BSPLINE':
+        w[:, 0] = -0.16666666 * t3 + 0.5 * t2 - 0.5 * t + 0.16666666
+        w[:, 1] = 0.5 * t3 - t2 + 0.66666666
+        w[:, 2] = -0.5 * t3 + 0.5 * t2 + 0.5 * t + 0.16666666
+        w[:, 3] = 0.16666666 * t3
+    else:# KEY_CARDINAL, KEY_CATMULL_ROM
+        fc = 0.5 if interp == 'KEY_CATMULL_ROM' else 0.71
+        w[:, 0] = -fc * t3 + 2.0 * fc * t2 - fc * t
+        w[:, 1] = (2.0 - fc) * t3 + (fc - 3.0) * t2 + 1.0
+        w[:, 2] = (fc - 2.0) * t3 + (3.0 - 2.0 * fc) * t2 + fc * t
+        w[:, 3] = fc * t3 - fc * t2
+    return w
+
+def axis_taps(x, count, first, step, interp):
+    '''Control point indices and weights along one lattice axis
+    x : (n,) lattice space coordinate on this axis
+    count : number of lattice points on this axis, first/step : rest grid spacing
+    return (n, k) indices and (n, k) weights
+    '''
+    if count == 1:
+        return np.zeros((len(x), 1), dtype=np.intp), np.ones((len(x), 1), dtype=x.dtype)
+    u = (x - first) / step
+    ui = np.floor(u)
+    w = key_curve_weights(u - ui, interp)
+    idx = ui.astype(np.intp)[:, None] + np.arange(-1, 3)
+    np.clip(idx, 0, count - 1, out=idx)# out of range points use border control points
+    if interp == 'KEY_LINEAR':
+        # outer taps are always zero
+        return idx[:, 1:3], w[:, 1:3]
+    return idx, w
+
+def get_lattice_data(lattice):
+    '''Return (rest, deformed) (n, 3) control points coordinates of a lattice'''
+    ct = len(lattice.points)
+    rest = np.empty(ct * 3, dtype=np.float32)
+    deform = np.empty(ct * 3, dtype=np.float32)
+    lattice.points.foreach_get('co', rest)
+    lattice.points.foreach_get('co_deform', deform)
+    return rest.reshape(-1, 3), deform.reshape(-1, 3)
+
+class LatticeWeights:
+    '''Sparse weight matrix mapping lattice control points to target points
+    Stored row-wise with a fixed number of taps per point (ELL layout):
+    idx, weights : (n, k) control point indices and weights of each target point
+    '''
+
+    def __init__(self, lco, dims, interps, rest):
+        '''lco : (n, 3) coordinates of target points in lattice space
+        dims : (points_u, points_v, points_w), interps : interpolation type of each axis
+        rest : (p, 3) rest positions of control points
+        '''
+        self.dims = tuple(dims)
+        self.interps = tuple(interps)
+        self.rest = rest
+
+        # rest grid is regular, get start and spacing of each axis from it
+        grid = rest.reshape(dims[2], dims[1], dims[0], 3)
+        ends = (grid[0, 0, -1], grid[0, -1, 0], grid[-1, 0, 0])
+        taps = []
+        for axis in range(3):
+            first = grid[0, 0, 0, axis]
+            step = (ends[axis][axis] - first) / (dims[axis] - 1) if dims[axis] > 1 else 1.0
+            taps.append(axis_taps(lco[:, axis], dims[axis], first, step, self.interps[axis]))
+
+        (iu, wu), (iv, wv), (iw, ww) = taps
+        dims = self.dims
+        n = len(lco)
+        self.idx = (iu[:, :, None, None]
+            + iv[:, None, :, None] * dims[0]
+            + iw[:, None, None, :] * (dims[0] * dims[1])).reshape(n, -1)
+        self.weights = (wu[:, :, None, None] * wv[:, None, :, None] * ww[:, None, None, :]).reshape(n, -1)
 
+    @classmethod
+    def from_lattice(cls, lco, lattice):
+        rest, _deform = get_lattice_data(lattice)
+        return cls(lco,
+            (lattice.points_u, lattice.points_v, lattice.points_w),
+            (lattice.interpolation_type_u, lattice.interpolation_type_v, lattice.interpolation_type_w),
+            rest)
+
+    def matches(self, lattice):
+        '''Return True if weights are still valid for this lattice resolution and interpolation'''
+        return self.dims == (lattice.points_u, lattice.points_v, lattice.points_w) \
+            and self.interps == (lattice.interpolation_type_u, lattice.interpolation_type_v, lattice.interpolation_type_w)
+
+    def apply(self, disp, workers=1, chunk_size=0):
+        '''Return (n, 3) offsets from (p, 3) control points displacements
+        workers, chunk_size : evaluate by chunks (bound the (n, k, 3) gathered displacements)
+        '''
+        return map_chunks(lambda start, end: self.apply_rows(disp, start, end), len(self.idx), workers, chunk_size)
+
+    def apply_rows(self, disp, start, end):
+        '''Return offsets of target points start to end'''
+        return np.einsum('nk,nkc->nc', self.weights[start:end], disp[self.idx[start:end]])
+
+
+def map_chunks(func, count, workers=1, chunk_size=0):
+    '''Return (count, 3) float64 array filled by func(start, end) on consecutive row chunks
+    Chunks are evaluated in a thread pool when workers > 1 (numpy kernels release the GIL)
+    Rows are independent so result is the same as a single pass
+    chunk_size : rows per chunk, 0 for a single pass
+    '''
+    if chunk_size <= 0 or count <= chunk_size:
+        return func(0, count)
+
+    out = np.empty((count, 3), dtype=np.float64)
+    def job(start):
+        end = min(start + chunk_size, count)
+        out[start:end] = func(start, end)
+
+    starts = range(0, count, chunk_size)
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(job, starts))# list to raise workers exceptions
+    else:
+        for start in starts:
+            job(start)
+    return out
+
+def map_chunks_steps(func, count, workers=1, chunk_size=0):
+    '''Same as map_chunks as a generator, yield after each batch of chunks (one chunk per worker)
+    so evaluation can be spread over several timer calls, return the (count, 3) array
+    '''
+    out = np.empty((count, 3), dtype=np.float64)
+    batch = max(chunk_size, 1) * max(workers, 1) if chunk_size > 0 else max(count, 1)
+    for first in range(0, count, batch):
+        last = min(first + batch, count)
+        out[first:last] = map_chunks(lambda start, end: func(first + start, first + end),
+            last - first, workers, chunk_size)
+        yield
+    return out
+
+def lattice_offsets(lco, dims, interps, rest, disp, workers=1, chunk_size=0):
+    '''Return (n, 3) lattice space offsets of points deformed by a lattice (one shot, weights are not kept)
+    Weights are built per chunk, so temporary memory is bound to chunk size
+    '''
+    disp = np.asarray(disp, dtype=np.float64)
+    def chunk(start, end):
+        return LatticeWeights(lco[start:end], dims, interps, rest).apply(disp)
+    return map_chunks(chunk, len(lco), workers, chunk_size)
+
+def chunk_settings():
+    '''Return (workers, chunk_size) for bulk deformations from addon preferences'''
+    prefs = get_addon_prefs_or_none()
+    if prefs is None:
+        return 1, 0
+    return prefs.eval_workers or os.cpu_count() or 1, prefs.eval_chunk_size
+
+
+def cage_state(lattice):
+    '''Return (dims, interps, co_deform) state of a lattice'''
+    _rest, deform = get_lattice_data(lattice)
+    return ((lattice.points_u, lattice.points_v, lattice.points_w),
+        (lattice.interpolation_type_u, lattice.interpolation_type_v, lattice.interpolation_type_w),
+        deform)
+
+def set_cage_state(lattice, state):
+    '''Set lattice resolution, interpolation and control points from a cage_state'''
+    dims, interps, deform = state
+    lattice.points_u, lattice.points_v, lattice.points_w = dims
+    lattice.interpolation_type_u, lattice.interpolation_type_v, lattice.interpolation_type_w = interps
+    lattice.points.foreach_set('co_deform', deform.ravel())
+
+def lattice_rest_grid(dims):
+    '''Rest positions of control points of a lattice with passed (points_u, points_v, points_w)
+    (same as a lattice object resolution set from python : -0.5 to 0.5 on axis with more than one point)
+    '''
+    axes = [np.linspace(-0.5, 0.5, n) if n > 1 else np.zeros(1) for n in dims]
+    w, v, u = np.meshgrid(axes[2], axes[1], axes[0], indexing='ij')
+    return np.stack((u, v, w), axis=-1).reshape(-1, 3).astype(np.float32)
+
+def lattice_space(cage_mat, obj_mat):
+    '''Return (latmat, offset_mat) for a cage and a deformed object world matrices
+    latmat : object space to lattice space matrix
+    offset_mat : lattice space to object space linear part, transposed (for (n, 3) @ offset_mat)
+    '''
+    latmat = np.linalg.inv(np.array(cage_mat, dtype=np.float64)) @ np.array(obj_mat, dtype=np.float64)
+    # offsets only need rotation and scale
+    return latmat, np.linalg.inv(latmat)[:3, :3].T
+
+def displace_targets(targets, offset, offset_mat):
+    '''Return all targeted strokes coordinates moved by (n, 3) lattice space offsets of targeted points
+    offset_mat : lattice space to object space linear part (transposed)
+    '''
+    co = targets.co.copy()
+    co[targets.mask] += (offset @ offset_mat).astype(np.float32)
+    return co
+
+
+class PointSamples:
+    '''Decimated subset of stacked targeted points for the live preview of big selections
+    Every step-th targeted point of each stroke (and its last one) is deformed,
+    offsets of points in between are interpolated along the stroke
+    stroke_ids : (n,) stroke of each targeted point (points of a stroke are contiguous)
+    '''
+
+    def __init__(self, stroke_ids, step):
+        self.step = step
+        n = len(stroke_ids)
+        index = np.arange(n)
+        starts = np.flatnonzero(np.r_[True, stroke_ids[1:] != stroke_ids[:-1]])
+        lengths = np.diff(np.r_[starts, n])
+        first = np.repeat(starts, lengths)
+        last = np.repeat(starts + lengths - 1, lengths)
+        left = first + (index - first) // step * step
+        right = np.minimum(left + step, last)
+        sampled = ((index - first) % step == 0) | (index == last)
+        self.indices = np.flatnonzero(sampled)
+        # sample row of previous and next sampled point of each point
+        row = np.cumsum(sampled) - 1
+        self.left = row[left]
+        self.right = row[right]
+        self.frac = ((index - left) / np.maximum(right - left, 1))[:, None]
+
+    def __len__(self):
+        return len(self.indices)
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.indices, self.left, self.right, self.frac))
+
+    def interpolate(self, offset):
+        '''Return (n, 3) offsets of all points from (len(self), 3) offsets of sampled points'''
+        return offset[self.left] * (1.0 - self.frac) + offset[self.right] * self.frac
+
+def preview_step(point_count, budget):
+    '''Return live preview decimation step for a selection size (1 : full resolution)
+    budget : maximum points deformed while dragging (0 : always full resolution)
+    '''
+    if not budget or point_count <= budget:
+        return 1
+    return -(-point_count // budget)
+
+def preview_budget(prefs):
+    return prefs.lod_point_budget if prefs.use_lod_preview else 0
+
+
+class BoxDeformSession:
+    '''Live state of a running box deform
+    Hold targeted points with their original positions and the lattice weight matrix
+    so each cage tweak is re-evaluated with a single sparse product
+    targets : list of GPTargets, one per object sharing the cage
+        (points of all objects are stacked in one weight matrix)
+    history : cage states checkpoints for in-modal undo (original points are kept in targets,
+        so stepping back only needs control points, whatever the selection size)
+    lod_step : live preview deform only every lod_step-th point of each stroke (see PointSamples),
+        on confirm all points are evaluated once by chunks (full=True), full weights are never kept
+    '''
+    history_limit = 64
+
+    def __init__(self, targets, cage, timer=None, lod_step=1):
+        self.targets = targets
+        self.cage = cage
+        self.timer = timer or PhaseTimer(False)
+        self.cage_name = cage.name
+        self.obj_names = [t.obj.name for t in targets]
+        # (latmat, offset_mat) of each object
+        self.spaces = [lattice_space(cage.matrix_world, t.obj.matrix_world) for t in targets]
+        self.lco = None
+        self.weights = None
+        self.lod_step = lod_step
+        self.samples = None
+        self.lod_weights = None
+        self.last_deform = None
+        self.written = False
+        self.history = [cage_state(cage.data)]
+        self.redo_history = []
+        self.auto_interp = None# modal interpolation auto swap state, restored on revive
+        for t in targets:
+            # targets may come from gather cache, nothing is written yet
+            t.dirty = t.touched = None
+        if all(t.loaded for t in targets):
+            self.rebuild()
+        # else targets points are read and weights computed on first deform
+
+    @property
+    def point_count(self):
+        return sum(len(t) for t in self.targets)
+
+    @property
+    def frame_count(self):
+        return sum(t.frame_count for t in self.targets)
+
+    @property
+    def nbytes(self):
+        '''Memory held by the session arrays (original points, lattice coordinates and weights)'''
+        arrays = [a for a in (self.lco, self.last_deform) if a is not None]
+        for weights in (self.weights, self.lod_weights):
+            if weights is not None:
+                arrays += [weights.idx, weights.weights]
+        nbytes = sum(t.nbytes for t in self.targets) + sum(a.nbytes for a in arrays)
+        return nbytes + (self.samples.nbytes if self.samples is not None else 0)
+
+    @property
+    def live_weights(self):
+        '''Weight matrix used at current level of detail'''
+        return self.lod_weights if self.lod_step > 1 else self.weights
+
+    def stroke_ids(self):
+        '''Stroke of each stacked targeted point (numbered across objects)'''
+        ids = []
+        base = 0
+        for t in self.targets:
+            ids.append(np.repeat(np.arange(base, base + len(t.counts)), t.counts)[t.mask])
+            base += len(t.counts)
+        return np.concatenate(ids)
+
+    def lattice_co(self):
+        '''Return (n, 3) lattice space coordinates of all targeted points (computed once)'''
+        if self.lco is None:
+            self.lco = np.concatenate([t.points @ latmat[:3, :3].T + latmat[:3, 3]
+                for t, (latmat, _offset_mat) in zip(self.targets, self.spaces)])
+        return self.lco
+
+    def rebuild(self):
+        '''Compute weight matrix, needed when cage resolution or interpolation change'''
+        with self.timer.phase('rebuild_weights'):
+            self.lattice_co()
+            if self.lod_step > 1:
+                if self.samples is None:
+                    self.samples = PointSamples(self.stroke_ids(), self.lod_step)
+                self.lod_weights = LatticeWeights.from_lattice(self.lco[self.samples.indices], self.cage.data)
+            else:
+                self.weights = LatticeWeights.from_lattice(self.lco, self.cage.data)
+        self.last_deform = None
+
+    def set_lod(self, step):
+        '''Deform only every step-th targeted point of each stroke from now (1 : full resolution)
+        Samples and their weights are kept while step does not change
+        '''
+        if step == self.lod_step:
+            return
+        if step > 1 and self.samples is not None and self.samples.step != step:
+            self.samples = self.lod_weights = None
+        self.lod_step = step
+        self.last_deform = None
+
+    def relink(self, objs, cage):
+        '''Link session to (new) objects and cage references, return False if data changed'''
+        if len(objs) != len(self.targets):
+            return False
+        if not all(t.resolve(obj) for t, obj in zip(self.targets, objs)):
+            return False
+        self.cage = cage
+        self.last_deform = None
+        self.written = True# undo restored original points, consider them changed
+        return True
+
+    def evaluator(self, full=False):
+        '''Return (func, count) evaluating current cage state, func(start, end) give (end - start, 3)
+        lattice space offsets of consecutive rows (sampled points in preview, see displaced)
+        full : all points of a preview session, weights are built per rows range and dropped
+        '''
+        lattice = self.cage.data
+        rest, deform = get_lattice_data(lattice)
+        disp = (deform - rest).astype(np.float64)
+        if full and self.lod_step > 1:
+            lco = self.lattice_co()
+            dims = (lattice.points_u, lattice.points_v, lattice.points_w)
+            interps = (lattice.interpolation_type_u, lattice.interpolation_type_v, lattice.interpolation_type_w)
+            func = lambda start, end: LatticeWeights(lco[start:end], dims, interps, rest).apply(disp)
+            count = len(lco)
+        else:
+            weights = self.live_weights
+            if weights is None or not weights.matches(lattice):
+                self.rebuild()
+                weights = self.live_weights
+            func = lambda start, end: weights.apply_rows(disp, start, end)
+            count = len(weights.idx)
+        self.last_deform = deform
+        return func, count
+
+    def displaced(self, offset, full=False):
+        '''Return targeted strokes coordinates of each object moved by (rows, 3) evaluator offsets'''
+        if self.lod_step > 1 and not full:
+            offset = self.samples.interpolate(offset)
+        splits = np.cumsum([len(t) for t in self.targets])[:-1]
+        return [displace_targets(t, part, offset_mat)
+            for t, part, (_latmat, offset_mat) in zip(self.targets, np.split(offset, splits), self.spaces)]
+
+    def deformed(self, chunks=(1, 0), full=False):
+        '''Return targeted strokes coordinates of each object deformed by current cage state
+        chunks : (workers, chunk_size) to evaluate by chunks
+        full : evaluate all points even in preview (confirm)
+        '''
+        func, count = self.evaluator(full)
+        return self.displaced(map_chunks(func, count, *chunks), full)
+
+    def changed(self, full=False):
+        '''Return True if written points do not match current cage state
+        full : compare to a full resolution state (written points of a preview never match)
+        '''
+        lattice = self.cage.data
+        rest, deform = get_lattice_data(lattice)
+        if full and self.lod_step > 1:
+            return self.written or not np.array_equal(rest, deform)
+        if self.last_deform is not None and self.live_weights is not None and self.live_weights.matches(lattice):
+            return not np.array_equal(deform, self.last_deform)
+        if not self.written:
+            # lazy targets : don't read all points while cage is untouched
+            return not np.array_equal(rest, deform)
+        return True
+
+    def update(self, force=False, chunks=(1, 0), reproject=None, full=False):
+        '''Write deformation on targets if cage points moved since last update
+        chunks : (workers, chunk_size) to evaluate by chunks (big confirm)
+        reproject : {object name: drawing_plane} to cast deformed points on it
+        full : deform all points even in preview (confirm)
+        '''
+        if not self.point_count:
+            return False
+        if not force and not self.changed(full):
+            return False
+        with self.timer.phase('live_update'):
+            # one write back per object, only strokes with moved points
+            for targets, co in zip(self.targets, self.deformed(chunks, full)):
+                if reproject is not None:
+                    co = reproject_targets(targets, co, reproject[targets.obj.name])
+                write_targets(targets, co, targets.pending(co))
+        self.written = True
+        self.timer.count(updates=self.timer.counts.get('updates', 0) + 1)
+        return True
+
+    def checkpoint(self):
+        '''Push cage state in history if it changed since last checkpoint, return True if pushed'''
+        state = cage_state(self.cage.data)
+        last = self.history[-1]
+        if state[:2] == last[:2] and np.array_equal(state[2], last[2]):
+            return False
+        self.history.append(state)
+        del self.history[:-self.history_limit]
+        self.redo_history.clear()
+        return True
+
+    def undo(self):
+        '''Set cage back to previous checkpoint, return False if nothing to undo'''
+        self.checkpoint()
+        if len(self.history) < 2:
+            return False
+        self.redo_history.append(self.history.pop())
+        set_cage_state(self.cage.data, self.history[-1])
+        self.update()
+        return True
+
+    def redo(self):
+        '''Set cage to next checkpoint undone, return False if nothing to redo'''
+        if self.checkpoint() or not self.redo_history:
+            return False
+        self.history.append(self.redo_history.pop())
+        set_cage_state(self.cage.data, self.history[-1])
+        self.update()
+        return True
+
+    def refresh(self):
+        '''Recalculate geometry of strokes touched by the session, return their count'''
+        with self.timer.phase('refresh_strokes'):
+            refreshed = sum(refresh_strokes(t) for t in self.targets)
+            for t in self.targets:
+                # keep gather cache from reusing baked strokes as original positions
+                t.expire_touched()
+        self.timer.count(refreshed_strokes=self.timer.counts.get('refreshed_strokes', 0) + refreshed)
+        return refreshed
+
+    def restore(self):
+        '''Write back original positions (if anything was changed)'''
+        if self.written:
+            for targets in self.targets:
+                write_targets(targets, targets.co, targets.touched_indices)
+                targets.dirty = targets.touched = None
+            self.written = False
+            self.last_deform = None
+
+
+## session running the modal (updated from depsgraph handler)
+active_session = None
+## sessions kept to revive the modal after a ctrl+Z back in lattice edit
+## (cage name, objects names) : session, oldest first
+revive_cache = OrderedDict()
+
+def revive_key(cage_name, obj_names):
+    return (cage_name, tuple(obj_names))
+
+def revive_cache_limit():
+    '''Return revive cache memory limit in bytes from addon preferences'''
+    prefs = get_addon_prefs_or_none()
+    return (prefs.revive_cache_size if prefs is not None else 512) * 1024 ** 2
+
+def cache_revive(session):
+    '''Keep session to revive the modal later, evict oldest sessions over memory limit'''
+    key = revive_key(session.cage_name, session.obj_names)
+    revive_cache.pop(key, None)
+    limit = revive_cache_limit()
+    if session.nbytes > limit:
+        return
+    revive_cache[key] = session
+    while sum(s.nbytes for s in revive_cache.values()) > limit:
+        revive_cache.popitem(last=False)
+
+def evict_revive(session):
+    key = revive_key(session.cage_name, session.obj_names)
+    if revive_cache.get(key) is session:
+        del revive_cache[key]
+
+@bpy.app.handlers.persistent
+def revive_cache_clear(*args):
+    revive_cache.clear()
+
+def box_deform_depsgraph_update(scene, depsgraph=None):
+    '''Re-evaluate deformation when cage points are moved'''
+    if active_session is not None:
+        active_session.update()
+
+def start_live_deform(session):
+    global active_session
+    active_session = session
+    cache_revive(session)
+    if box_deform_depsgraph_update not in bpy.app.handlers.depsgraph_update_post:
+        bpy.app.handlers.depsgraph_update_post.append(box_deform_depsgraph_update)
+
+def stop_live_deform():
+    global active_session
+    active_session = None
+    if box_deform_depsgraph_update in bpy.app.handlers.depsgraph_update_post:
+        bpy.app.handlers.depsgraph_update_post.remove(box_deform_depsgraph_update)
+
+
+def cage_matrix(view_matrix, center, size_x, size_y):
+    '''Return cage world matrix facing the view, centered and scaled on the points box'''
+    # avoid a flat (non invertible) cage when points are aligned
+    size_x, size_y = max(size_x, 1e-4), max(size_y, 1e-4)
+    rot = view_matrix.inverted().to_quaternion().to_matrix().to_4x4()
+    return Matrix.Translation(center) @ rot @ Matrix.Diagonal((size_x, size_y, 1, 1))
+
+
+def fit_cage(coords, persp_mat, view_matrix, width, height):
+    '''Return world matrix of a cage facing the view and framing (n, 3) world coordinates
+    persp_mat : view projection matrix, view_matrix : world to view matrix
+    width, height : size of the projected area (region or render resolution)
+    return None if all points are behind the view
+    '''
     ## get view coordinate of all points
-    coords2D = [location_to_region(co) for co in coords]
+    coords2D = project_to_region(persp_mat, width, height, coords)
+    if not len(coords2D):
+        return None
 
     # find centroid for depth (or more economic, use obj origin...)
     centroid = np.mean(coords, axis=0)
 
     # not a mean ! a mean of extreme ! centroid2d = np.mean(coords2D, axis=0)
-    all_x, all_y = np.array(coords2D)[:, 0], np.array(coords2D)[:, 1]
-    min_x, min_y = np.min(all_x), np.min(all_y)
-    max_x, max_y = np.max(all_x), np.max(all_y)
+    min_x, min_y = coords2D.min(axis=0)
+    max_x, max_y = coords2D.max(axis=0)
 
-    width = (max_x - min_x)
-    height = (max_y - min_y)
-    center_x = min_x + (width/2)
-    center_y = min_y + (height/2)
+    width_2d = (max_x - min_x)
+    height_2d = (max_y - min_y)
+    center_x = min_x + (width_2d/2)
+    center_y = min_y + (height_2d/2)
 
-    centroid2d = (center_x,center_y)
-    center = region_to_location(centroid2d, centroid)
+    # center, corner Bottom-left, Bottom-right and top-left in one unprojection
+    center, x0, x1, y1 = region_to_world(persp_mat, width, height,
+        ((center_x, center_y), (min_x, min_y), (max_x, min_y), (min_x, max_y)), centroid)
     # bpy.context.scene.cursor.location = center#Dbg
 
-
     #corner Bottom-left to Bottom-right
-    x0 = region_to_location((min_x, min_y), centroid)
-    x1 = region_to_location((max_x, min_y), centroid)
-    x_worldsize = (x0 - x1).length
+    x_worldsize = np.linalg.norm(x0 - x1)
 
     #corner Bottom-left to top-left
-    y0 = region_to_location((min_x, min_y), centroid)
-    y1 = region_to_location((min_x, max_y), centroid)
-    y_worldsize = (y0 - y1).length
-
-    ## in case of 3
+    y_worldsize = np.linalg.norm(x0 - y1)
+
+    return cage_matrix(view_matrix, center, x_worldsize, y_worldsize)
+
+def local_cage(co, obj_mat):
+    '''Return world matrix of a cage aligned on object local axis and framing (n, 3) object space coordinates
+    The cage faces the thinnest axis of the points bounding box (Y, GP front plane, on ties)
+    Bounds are taken directly in object space, only the cage is transformed
+    '''
+    bmin, bmax = co.min(axis=0), co.max(axis=0)
+    size = bmax - bmin
+    normal = min((1, 0, 2), key=lambda i: size[i])
+    u, v = {0: (1, 2), 1: (0, 2), 2: (0, 1)}[normal]
+
+    axis_u, axis_v = np.eye(3)[u], np.eye(3)[v]
+    rot = Matrix((axis_u, axis_v, np.cross(axis_u, axis_v))).transposed().to_4x4()
+    # avoid a flat (non invertible) cage when points are aligned
+    scale = Matrix.Diagonal((max(size[u], 1e-4), max(size[v], 1e-4), 1, 1))
+    return obj_mat @ Matrix.Translation((bmin + bmax) / 2) @ rot @ scale
+
+def gather_all(objs, mode):
+    '''Return GPTargets of each object holding points to deform in passed mode (or an error string)
+    targets of last invocation are reused if object did not change
+    '''
+    all_targets = []
+    for obj in objs:
+        targets = cached_gather(obj, mode)
+        if isinstance(targets, str):
+            return targets
+        if len(targets):
+            all_targets.append(targets)
+    return all_targets
+
+def fit_targets_cage(all_targets, orientation, persp_mat=None, view_matrix=None, width=2, height=2):
+    '''Return cage world matrix fitted on targets (None if no point is in front of the view)
+    orientation : 'LOCAL' on first target object axis, or 'VIEW' facing view_matrix (fitted through persp_mat)
+    '''
+    # object space coordinates to fit (only strokes bounds corners in object mode)
+    if orientation == 'LOCAL':
+        ## Local axis Mode --- no per point transform nor projection
+        ## (other objects points are brought in the active object space)
+        # (first object with points, usually the active one)
+        ref_obj = all_targets[0].obj
+        ref_mat = ref_obj.matrix_world
+        fit_co = np.concatenate([t.fit_co() if t.obj == ref_obj else
+            apply_matrix(ref_mat.inverted() @ t.obj.matrix_world, t.fit_co()) for t in all_targets])
+        return local_cage(fit_co, ref_mat)
 
-    lattice_name = 'lattice_cage_deform'
-    # cleaning
-    cage = bpy.data.objects.get(lattice_name)
-    if cage:
-        bpy.data.objects.remove(cage)
-
-    lattice = bpy.data.lattices.get(lattice_name)
-    if lattice:
-        bpy.data.lattices.remove(lattice)
-
-    # create lattice object
-    lattice = bpy.data.lattices.new(lattice_name)
-    cage = bpy.data.objects.new(lattice_name, lattice)
-    cage.show_in_front = True
-
-    ## Master (root) collection
-    bpy.context.scene.collection.objects.link(cage)
+    ## View axis Mode ---
+    # get real location, all points at once
+    coords = np.concatenate([apply_matrix(t.obj.matrix_world, t.fit_co()) for t in all_targets])
+    return fit_cage(coords, persp_mat, view_matrix, width, height)
+
+def reset_cage(scene, cage_mat, interp):
+    '''Place pooled cage at cage_mat with a 2x2 resolution and no deformation, return it'''
+    # reuse pooled lattice object (created only once per file)
+    cage = get_cage(scene)
+    lattice = cage.data
 
     # spawn cage and align it to view (Again ! align something to a vector !!! argg)
-
-    r3d = bpy.context.space_data.region_3d
-    viewmat = r3d.view_matrix
-
-    cage.matrix_world = viewmat.inverted()
-    cage.scale = (x_worldsize, y_worldsize, 1)
     ## Z aligned in view direction (need minus X 90 degree to be aligned FRONT)
-    # cage.rotation_euler.x -= radians(90)
-    # cage.scale = (x_worldsize, 1, y_worldsize)
-    cage.location = center
+    cage.matrix_world = cage_mat
 
     lattice.points_u = 2
     lattice.points_v = 2
     lattice.points_w = 1
 
-    lattice.interpolation_type_u = lattice_interp#'KEY_LINEAR'-'KEY_BSPLINE'
-    lattice.interpolation_type_v = lattice_interp#'KEY_LINEAR'-'KEY_BSPLINE'
-    lattice.interpolation_type_w = lattice_interp#'KEY_LINEAR'-'KEY_BSPLINE'
-
-    mod = obj.grease_pencil_modifiers.new('tmp_lattice', 'GP_LATTICE')
-
-    # move to top if modifiers exists
-    for _ in range(len(obj.grease_pencil_modifiers)):
-        bpy.ops.object.gpencil_modifier_move_up(modifier='tmp_lattice')
+    lattice.interpolation_type_u = interp#'KEY_LINEAR'-'KEY_BSPLINE'
+    lattice.interpolation_type_v = interp#'KEY_LINEAR'-'KEY_BSPLINE'
+    lattice.interpolation_type_w = interp#'KEY_LINEAR'-'KEY_BSPLINE'
 
-    mod.object = cage
-
-    if initial_mode == 'PAINT_GPENCIL':
-        mod.layer = gpl.active.info
+    # reset deformation left by previous use
+    rest, _deform = get_lattice_data(lattice)
+    lattice.points.foreach_set('co_deform', rest.ravel())
+    return cage
 
-    # note : if initial was Paint, changed to Edit
-    #        so vertex attribution is valid even for paint
-    if bpy.context.mode == 'EDIT_GPENCIL':
-        mod.vertex_group = vg.name
+def view_cage(objs, timer=None):
+    '''Create the lattice cage facing the view around points to deform
+    objs : GP objects sharing the cage (active object first, local axis are taken from
+        the first one with points, objects without points are left out of the session)
+    timer : optional PhaseTimer recording phases duration
+    return a BoxDeformSession or an error string
+    '''
+    timer = timer or PhaseTimer(False)
 
-    #Go in object mode if not already
-    if bpy.context.mode != 'OBJECT':
-        bpy.ops.object.mode_set(mode='OBJECT')
+    prefs = get_addon_prefs()
+    lattice_interp = prefs.default_deform_type
 
-    # Store name of deformed object in case of 'revive modal' 
-    cage.vertex_groups.new(name=obj.name)
+    initial_mode = bpy.context.mode
 
-    ## select and make cage active
-    # cage.select_set(True)
-    bpy.context.view_layer.objects.active = cage
-    obj.select_set(False)#deselect GP object
-    bpy.ops.object.mode_set(mode='EDIT')# go in lattice edit mode
-    bpy.ops.lattice.select_all(action='SELECT')# select all points
+    ## get points
+    with timer.phase('gather'):
+        all_targets = gather_all(objs, initial_mode)
+        if isinstance(all_targets, str):
+            return all_targets
 
-    ## Eventually change tool mode to tweak for direct point editing (reset after before leaving)
-    bpy.ops.wm.tool_set_by_id(name="builtin.select")# Tweaktoolcode
-    return cage
+    point_ct = sum(len(t) for t in all_targets)
+    if not point_ct:
+        ## maybe silent return instead (need special str code to manage errorless return)
+        return 'No points found!'
 
+    if bpy.context.mode in ('EDIT_GPENCIL', 'PAINT_GPENCIL') and point_ct < 2:
+        # Dont block object mod
+        return 'Less than two point selected'
 
-def back_to_obj(obj, gp_mode, org_lattice_toolset, context):
+    timer.count(points=point_ct, strokes=sum(len(t.strokes) for t in all_targets),
+        frames=sum(t.frame_count for t in all_targets), objects=len(all_targets))
+
+    with timer.phase('fit_cage'):# projection and bbox
+        if prefs.cage_orientation == 'LOCAL':
+            cage_mat = fit_targets_cage(all_targets, 'LOCAL')
+        else:
+            region = bpy.context.region
+            r3d = bpy.context.space_data.region_3d
+            cage_mat = fit_targets_cage(all_targets, 'VIEW', r3d.perspective_matrix, r3d.view_matrix, region.width, region.height)
+            if cage_mat is None:
+                return 'No points in front of the view!'
+
+    with timer.phase('cage_setup'):
+        cage = reset_cage(bpy.context.scene, cage_mat, lattice_interp)
+
+    with timer.phase('weights'):
+        # weights are computed once here, then each cage tweak is a single product
+        # (on a subset of points for big selections, full resolution on confirm)
+        lod_step = preview_step(point_ct, preview_budget(prefs))
+        timer.count(lod_step=lod_step)
+        session = BoxDeformSession(all_targets, cage, timer=timer, lod_step=lod_step)
+
+    with timer.phase('mode_switch'):
+        #Go in object mode if not already
+        if bpy.context.mode != 'OBJECT':
+            bpy.ops.object.mode_set(mode='OBJECT')
+
+        # Store name of deformed objects in case of 'revive modal' (same list as session.obj_names)
+        cage.vertex_groups.clear()
+        for name in session.obj_names:
+            cage.vertex_groups.new(name=name)
+
+        ## select and make cage active
+        # cage.select_set(True)
+        bpy.context.view_layer.objects.active = cage
+        for obj in objs:
+            obj.select_set(False)#deselect GP objects
+        bpy.ops.object.mode_set(mode='EDIT')# go in lattice edit mode
+        bpy.ops.lattice.select_all(action='SELECT')# select all points
+
+        ## Eventually change tool mode to tweak for direct point editing (reset after before leaving)
+        bpy.ops.wm.tool_set_by_id(name="builtin.select")# Tweaktoolcode
+    return session
+
+
+def back_to_obj(objs, gp_mode, org_lattice_toolset, context):
     if context.mode == 'EDIT_LATTICE' and org_lattice_toolset:# Tweaktoolcode - restore the active tool used by lattice edit..
         bpy.ops.wm.tool_set_by_id(name = org_lattice_toolset)# Tweaktoolcode
     
-    # gp object active and selected
+    # gp objects selected, first one active (selection as it was at invoke)
     bpy.ops.object.mode_set(mode='OBJECT')
-    obj.select_set(True)
-    bpy.context.view_layer.objects.active = obj
+    for obj in objs:
+        obj.select_set(True)
+    bpy.context.view_layer.objects.active = objs[0]
+
+
+CAGE_NAME = 'lattice_cage_deform'
+
+def get_cage(scene):
+    '''Return the pooled cage object, visible and linked in scene
+    The lattice object is created once per file then reset in place on each use
+    (avoid datablocks creation/deletion and orphan data on each invocation)
+    '''
+    cage = bpy.data.objects.get(CAGE_NAME)
+    if not cage or cage.type != 'LATTICE':
+        if cage:
+            cage.name = CAGE_NAME + '_old'# name used by something else, keep it aside
+        lattice = bpy.data.lattices.get(CAGE_NAME) or bpy.data.lattices.new(CAGE_NAME)
+        cage = bpy.data.objects.new(CAGE_NAME, lattice)
+        cage.show_in_front = True
 
+    ## Master (root) collection
+    if not scene.objects.get(cage.name):
+        scene.collection.objects.link(cage)
 
-def delete_cage(cage):
-    lattice = cage.data
-    bpy.data.objects.remove(cage)
-    bpy.data.lattices.remove(lattice)
+    cage.hide_viewport = cage.hide_render = False
+    cage.hide_set(False)
+    return cage
 
-def apply_cage(gp_obj, cage):
-    mod = gp_obj.grease_pencil_modifiers.get('tmp_lattice')
-    if mod:
-        bpy.ops.object.gpencil_modifier_apply(apply_as='DATA', modifier=mod.name)
-    else:
-        print('tmp_lattice modifier not found to apply...')
+def release_cage(cage):
+    '''Hide pooled cage and exclude it from evaluation until next use'''
+    cage.select_set(False)
+    cage.hide_viewport = cage.hide_render = True
 
-    delete_cage(cage)
+LEGACY_GROUP_NAME = 'lattice_cage_deform_group'
 
-def cancel_cage(gp_obj, cage):
-    #remove modifier
+def clean_legacy_data(gp_obj):
+    '''Remove lattice modifier and vertex group left by previous versions of the addon
+    (points are now targeted by index and mask, no group is created anymore)
+    '''
     mod = gp_obj.grease_pencil_modifiers.get('tmp_lattice')
     if mod:
+        print('Deleted remaining lattice modifiers')
         gp_obj.grease_pencil_modifiers.remove(mod)
+
+    vg = gp_obj.vertex_groups.get(LEGACY_GROUP_NAME)
+    if vg:
+        # weights are only freed on strokes holding some (strokes without dvert are skipped)
+        print(f'Deleted remaining {LEGACY_GROUP_NAME} vertex group')
+        gp_obj.vertex_groups.remove(vg)
+
+def get_frame_range(scene):
+    '''Return (start, end) scene frame range (preview range if used)'''
+    if scene.use_preview_range:
+        return scene.frame_preview_start, scene.frame_preview_end
+    return scene.frame_start, scene.frame_end
+
+def propagate_steps(session, frame_start, frame_end, reproject=None):
+    '''Deform frames in range on the targeted layers with the current cage
+    Points of each frame are targeted as in the invocation mode (see gather_frame)
+    Stream one frame at a time (peak memory bound to the largest frame, not the range)
+    Frames already deformed by the session are skipped
+    reproject : optional {object name: drawing_plane}
+    yield (frame_targets, done, total) after each frame (frame_targets.co keep original positions)
+    '''
+    lattice = session.cage.data
+    rest, deform = get_lattice_data(lattice)
+    dims = (lattice.points_u, lattice.points_v, lattice.points_w)
+    interps = (lattice.interpolation_type_u, lattice.interpolation_type_v, lattice.interpolation_type_w)
+    disp = deform - rest
+    chunks = chunk_settings()
+
+    jobs = []
+    for targets, (latmat, offset_mat) in zip(session.targets, session.spaces):
+        done = {key[:2] for key in targets.keys}
+        layers = targets.obj.data.layers
+        jobs += [(targets.obj, targets.mode, latmat, offset_mat, li, f)
+            for li in sorted({key[0] for key in targets.keys}) for f in layers[li].frames
+            if frame_start <= f.frame_number <= frame_end and (li, f.frame_number) not in done]
+
+    for i, (obj, mode, latmat, offset_mat, li, f) in enumerate(jobs):
+        frame_targets = gather_frame(obj, li, f, mode)
+        if len(frame_targets):
+            lco = frame_targets.points @ latmat[:3, :3].T + latmat[:3, 3]
+            offset = lattice_offsets(lco, dims, interps, rest, disp, *chunks)
+            co = displace_targets(frame_targets, offset, offset_mat)
+            if reproject is not None:
+                co = reproject_targets(frame_targets, co, reproject[obj.name])
+            write_targets(frame_targets, co, frame_targets.pending(co))
+            refresh_strokes(frame_targets)
+        yield frame_targets, i + 1, len(jobs)
+
+def propagate_cage(session, frame_start, frame_end, progress=None, reproject=None):
+    '''Deform all frames in range on the targeted layers at once (see propagate_steps)
+    progress : optional callback(done, total) called after each frame
+    return (deformed points count, frames count)
+    '''
+    point_ct = frame_ct = refreshed = 0
+    for frame_targets, done, total in propagate_steps(session, frame_start, frame_end, reproject=reproject):
+        point_ct += len(frame_targets)
+        frame_ct = total
+        refreshed += len(frame_targets.touched_indices)
+        if progress:
+            progress(done, total)
+    session.timer.count(refreshed_strokes=session.timer.counts.get('refreshed_strokes', 0) + refreshed)
+    return point_ct, frame_ct
+
+def apply_cage(session, frame_range=None, progress=None, reproject=None):
+    '''Bake cage deformation on GP points (direct write, no modifier apply, no mode switch)
+    All targeted frames (selected frames in multiframe edit) are deformed in the same pass
+    frame_range : (start, end) to also deform all other frames of targeted layers in this range
+    reproject : optional {object name: drawing_plane}, deformed points are cast on it
+    return (deformed points count, frames count)
+    '''
+    timer = session.timer
+    stop_live_deform()
+    with timer.phase('apply'):
+        # write only if live update missed last cage state, was a preview (or to reproject)
+        session.update(force=reproject is not None, chunks=chunk_settings(), reproject=reproject, full=True)
+    # geometry of strokes moved during the whole session (live updates included)
+    session.refresh()
+    point_ct, frame_ct = session.point_count, session.frame_count
+    if frame_range is not None:
+        with timer.phase('propagate'):
+            range_points, range_frames = propagate_cage(session, *frame_range, progress=progress, reproject=reproject)
+        point_ct += range_points
+        frame_ct += range_frames
+    with timer.phase('release_cage'):
+        release_cage(session.cage)
+    # keep it to revive after a ctrl+Z (size updated now that all data is computed)
+    cache_revive(session)
+    timer.count(points=point_ct, frames=frame_ct)
+    return point_ct, frame_ct
+
+class AsyncApply:
+    '''Bake cage deformation by chunks from bpy.app.timers to keep the UI responsive
+    Each timer call writes strokes (or propagated frames) until the time budget is spent
+    cancel() write back original positions of everything already baked
+    error : message of the exception that stopped baking (points are restored if possible)
+    '''
+    stroke_chunk = 32# strokes written between two budget checks
+    eval_chunk = 16384# points evaluated between two budget checks when chunk size preference is 0
+
+    def __init__(self, session, frame_range=None, reproject=None, budget_ms=20, area=None):
+        self.session = session
+        self.budget = budget_ms / 1000
+        self.area = area
+        self.baked = []# touched strokes of propagated frames (co keep original positions)
+        self.done = False
+        self.error = None
+        self.status = ''
+        self.point_ct = self.frame_ct = 0
+        self.steps = self.run(frame_range, reproject)
+        self._tick = self.tick# timers are compared by identity, keep one bound method
+
+    def run(self, frame_range, reproject):
+        session = self.session
+        if reproject is not None or session.changed(full=True):
+            # evaluate by chunks too, a big selection must not block the interface in one step
+            workers, chunk_size = chunk_settings()
+            func, count = session.evaluator(full=True)
+            offset = yield from map_chunks_steps(func, count, workers, chunk_size or self.eval_chunk)
+            cos = session.displaced(offset, full=True)
+            session.written = True
+            for targets, co in zip(session.targets, cos):
+                if reproject is not None:
+                    co = reproject_targets(targets, co, reproject[targets.obj.name])
+                indices = targets.pending(co)
+                total = len(indices)
+                for first in range(0, total, self.stroke_chunk):
+                    write_targets(targets, co, indices[first:first + self.stroke_chunk])
+                    self.status = f'{targets.obj.name} {min(first + self.stroke_chunk, total)}/{total} strokes'
+                    yield
+        self.point_ct, self.frame_ct = session.point_count, session.frame_count
+
+        if frame_range is not None:
+            refreshed = 0
+            for frame_targets, done, total in propagate_steps(session, *frame_range, reproject=reproject):
+                # cancel only need original positions of written strokes, drop the rest of the frame
+                if frame_targets.touched is not None:
+                    self.baked.append(frame_targets.touched_subset())
+                self.point_ct += len(frame_targets)
+                self.frame_ct = session.frame_count + total
+                refreshed += len(frame_targets.touched_indices)
+                self.status = f'frame {done}/{total}'
+                yield
+            session.timer.count(refreshed_strokes=refreshed)
+
+        # last step (not cancelable anymore) : geometry of strokes moved during the session
+        session.refresh()
+
+    def start(self):
+        stop_live_deform()
+        release_cage(self.session.cage)
+        bpy.app.timers.register(self._tick)
+
+    def tick(self):
+        with self.session.timer.phase('apply'):
+            end = time.perf_counter() + self.budget
+            try:
+                while time.perf_counter() < end:
+                    next(self.steps)
+            except StopIteration:
+                self.done = True
+                cache_revive(self.session)
+            except Exception as e:
+                # stroke references or data changed under us : put back what was baked
+                self.error = str(e)
+                print(f'Box deform: background apply failed: {e}')
+                try:
+                    self.cancel()
+                except Exception as e:
+                    self.error += f' (original points not restored: {e})'
+                    self.done = True
+        if self.area:
+            self.area.header_text_set(None if self.done else f'Box deform applying : {self.status} (Esc/Del/Backspace: cancel)')
+        return None if self.done else 0.001
+
+    def cancel(self):
+        '''Stop baking and write back original positions'''
+        if bpy.app.timers.is_registered(self._tick):
+            bpy.app.timers.unregister(self._tick)
+        self.steps.close()
+        self.session.restore()
+        evict_revive(self.session)
+        for frame_targets in self.baked:
+            write_targets(frame_targets, frame_targets.co, frame_targets.touched_indices)
+            # geometry was refreshed on deformed positions
+            refresh_strokes(frame_targets)
+        self.baked.clear()
+        self.done = True
+
+def cancel_cage(session):
+    '''Restore original GP points positions'''
+    stop_live_deform()
+    with session.timer.phase('restore'):
+        session.restore()
+        # back to gathered state, next invocation can reuse targets
+        for targets in session.targets:
+            recache_targets(targets)
+    with session.timer.phase('release_cage'):
+        release_cage(session.cage)
+    evict_revive(session)
+
+
+## --- Headless API (no viewport, usable in background)
+
+SELECT_MODES = {'ALL': 'OBJECT', 'SELECTED': 'EDIT_GPENCIL', 'LAST_STROKE': 'PAINT_GPENCIL'}
+
+def camera_view(camera, scene):
+    '''Return (persp_mat, view_matrix, width, height) to fit a cage through a camera'''
+    render = scene.render
+    width = max(1, int(render.resolution_x * render.resolution_percentage / 100))
+    height = max(1, int(render.resolution_y * render.resolution_percentage / 100))
+    proj = camera.calc_matrix_camera(bpy.context.evaluated_depsgraph_get(),
+        x=width, y=height, scale_x=render.pixel_aspect_x, scale_y=render.pixel_aspect_y)
+    view_matrix = camera.matrix_world.inverted()
+    return proj @ view_matrix, view_matrix, width, height
+
+def box_deform_apply(obj, displacement, select_mode='ALL', resolution=(2, 2),
+        interpolation='KEY_LINEAR', view_matrix=None, camera=None, cage_mat=None):
+    '''Deform GP points with a box cage in one call, without modal, viewport or region
+
+    displacement : (points_u * points_v, 2 or 3) offsets of control points in cage space,
+        the cage spanning -0.5 to 0.5 on X and Y, points ordered along U (X) first
+    select_mode : 'ALL', 'SELECTED' or 'LAST_STROKE' (points deformed in object, edit and paint modal)
+    view_matrix : world to view matrix giving the cage axis (orthographic fit)
+    camera : camera object to fit the cage through its projection (used if no view_matrix)
+        if neither is given, the cage is aligned on object local axis
+    cage_mat : world matrix of the cage, used as is (no fit on points)
+    return number of deformed points or an error string
+    '''
+    dims = (resolution[0], resolution[1], 1)
+    disp = np.zeros((dims[0] * dims[1], 3))
+    displacement = np.asarray(displacement, dtype=np.float64)
+    if displacement.ndim != 2 or len(displacement) != len(disp) or displacement.shape[1] not in (2, 3):
+        return f'Expected {len(disp)} control points displacement (2D or 3D), got shape {displacement.shape}'
+    disp[:, :displacement.shape[1]] = displacement
+
+    targets = gather_targets(obj, SELECT_MODES[select_mode])
+    if isinstance(targets, str):
+        return targets
+    if not len(targets):
+        return 'No points found!'
+
+    if cage_mat is not None:
+        cage_mat = Matrix(cage_mat)
+    elif view_matrix is None and camera is None:
+        cage_mat = local_cage(targets.fit_co(), obj.matrix_world)
     else:
-        print('tmp_lattice modifier not found to remove...')
-    
-    delete_cage(cage)
-    
+        if view_matrix is not None:
+            view_matrix = Matrix(view_matrix)
+            persp_mat, width, height = view_matrix, 2, 2
+        else:
+            persp_mat, view_matrix, width, height = camera_view(camera, bpy.context.scene)
+
+        coords = apply_matrix(obj.matrix_world, targets.fit_co())
+        cage_mat = fit_cage(coords, persp_mat, view_matrix, width, height)
+        if cage_mat is None:
+            return 'No points in front of the view!'
+
+    latmat, offset_mat = lattice_space(cage_mat, obj.matrix_world)
+    lco = targets.points @ latmat[:3, :3].T + latmat[:3, 3]
+    offset = lattice_offsets(lco, dims, (interpolation,) * 3, lattice_rest_grid(dims), disp, *chunk_settings())
+    co = displace_targets(targets, offset, offset_mat)
+    write_targets(targets, co, targets.pending(co))
+    refresh_strokes(targets)
+    return len(targets)
+
+
+## --- Records (replay a confirmed cage deformation without modal)
+
+RECORD_FIELDS = ('cage_matrix', 'dims', 'interpolation', 'co_deform')
+
+def save_record(directory, cage):
+    '''Save cage placement and deformation as a single structured numpy record (.npy, memory mappable)
+    return saved filepath
+    '''
+    lattice = cage.data
+    _rest, deform = get_lattice_data(lattice)
+    record = np.zeros(1, dtype=[('cage_matrix', np.float64, (4, 4)), ('dims', np.int32, 3),
+        ('interpolation', 'U16'), ('co_deform', np.float32, deform.shape)])
+    record['cage_matrix'] = np.array(cage.matrix_world)
+    record['dims'] = (lattice.points_u, lattice.points_v, lattice.points_w)
+    record['interpolation'] = lattice.interpolation_type_u
+    record['co_deform'] = deform
+
+    os.makedirs(directory, exist_ok=True)
+    now = time.time()
+    filepath = os.path.join(directory, time.strftime('box_deform_%Y%m%d_%H%M%S', time.localtime(now)) + f'_{int(now * 1000) % 1000:03d}.npy')
+    np.save(filepath, record)
+    return filepath
+
+def load_record(filepath):
+    '''Return record memory-mapped from file or an error string'''
+    try:
+        record = np.load(filepath, mmap_mode='r')
+    except (OSError, ValueError) as e:
+        return f'Cannot read record {filepath} : {e}'
+    if record.dtype.names is None or not set(RECORD_FIELDS).issubset(record.dtype.names) or record.shape != (1,):
+        return f'{os.path.basename(filepath)} is not a box deform record'
+    # control points must match cage resolution (replay would fail after other records were written)
+    dims = record['dims'][0]
+    if np.any(dims < 1) or record['co_deform'].shape[1:] != (int(np.prod(dims)), 3):
+        return f'{os.path.basename(filepath)} : control points do not match cage resolution {tuple(int(d) for d in dims)}'
+    return record
+
+def record_files(path):
+    '''Return record file in a list, or all records of a directory sorted by name'''
+    if os.path.isdir(path):
+        return [os.path.join(path, f) for f in sorted(os.listdir(path)) if f.lower().endswith('.npy')]
+    return [path] if os.path.isfile(path) else []
+
+def replay_record(obj, record, select_mode='ALL', placement='FIT'):
+    '''Apply a saved cage deformation on GP points
+    placement : 'RECORDED' use the cage where it was recorded, 'FIT' fit the cage on points with recorded orientation
+    return number of deformed points or an error string
+    '''
+    dims = tuple(int(d) for d in record['dims'][0])
+    if dims[2] != 1:
+        return f'Cannot replay cage with {dims[2]} points in depth'
+    disp = np.asarray(record['co_deform'][0], dtype=np.float64) - lattice_rest_grid(dims)
+    cage_mat = Matrix(record['cage_matrix'][0].tolist())
+    interpolation = str(record['interpolation'][0])
+
+    if placement == 'RECORDED':
+        return box_deform_apply(obj, disp, select_mode, dims[:2], interpolation, cage_mat=cage_mat)
+    # cage faces the view : view axis are the inverted cage rotation
+    view_matrix = cage_mat.to_quaternion().to_matrix().to_4x4().inverted()
+    return box_deform_apply(obj, disp, select_mode, dims[:2], interpolation, view_matrix=view_matrix)
+
+
+## --- Modal keys
+
+## action : (label, operator method, method arguments)
+MODAL_ACTIONS = {
+    'CONFIRM': ("Confirm (+shift: all frames in range, +alt: toggle reproject)", 'confirm', ()),
+    'CANCEL': ("Cancel", 'cancel_modal', ()),
+    'TAB_CANCEL': ("Cancel (hit twice)", 'tab_cancel', ()),
+    'UNDO': ("Undo cage change", 'undo_cage', ()),
+    'REDO': ("Redo cage change", 'redo_cage', ()),
+    'TOGGLE_INTERP': ("Toggle Linear / Spline", 'toggle_interp', ()),
+    'ADD_U': ("Add X subdivision", 'step_resolution', (1, 0)),
+    'REMOVE_U': ("Remove X subdivision", 'step_resolution', (-1, 0)),
+    'ADD_V': ("Add Y subdivision", 'step_resolution', (0, 1)),
+    'REMOVE_V': ("Remove Y subdivision", 'step_resolution', (0, -1)),
+    'GRID_2X1': ("Box 2x1", 'set_resolution', (2, 1)),
+    **{f'GRID_{i}': (f"Box {i}x{i}", 'set_resolution', (i, i)) for i in range(2, 11)},
+    'NO_HIDE': ("Hide (try it)", 'no_hide', ()),
+}
+
+## (action, event type, ctrl, shift, alt)
+DEFAULT_MODAL_KEYS = (
+    ('CONFIRM', 'RET', False, False, False),
+    ('CONFIRM', 'SPACE', False, False, False),
+    ('CANCEL', 'DEL', False, False, False),
+    ('CANCEL', 'BACK_SPACE', False, False, False),
+    ('CANCEL', 'T', True, False, False),
+    ('TAB_CANCEL', 'TAB', False, False, False),
+    ('UNDO', 'Z', True, False, False),
+    ('REDO', 'Z', True, True, False),
+    ('TOGGLE_INTERP', 'M', False, False, False),
+    ('ADD_U', 'RIGHT_ARROW', True, False, False),
+    ('REMOVE_U', 'LEFT_ARROW', True, False, False),
+    ('ADD_V', 'UP_ARROW', True, False, False),
+    ('REMOVE_V', 'DOWN_ARROW', True, False, False),
+    ('GRID_2X1', 'ZERO', False, False, False),
+    *((f'GRID_{i + 1}', key, False, False, False) for i, key in enumerate(
+        ('ONE', 'TWO', 'THREE', 'FOUR', 'FIVE', 'SIX', 'SEVEN', 'EIGHT', 'NINE'), start=1)),
+    ('NO_HIDE', 'H', False, False, False),
+)
+
+def modal_key_table(prefs):
+    '''Return {(event type, ctrl, shift, alt): action} from keys customized in preferences (default keys if none)'''
+    keys = [(k.action, k.type, k.ctrl, k.shift, k.alt) for k in prefs.modal_keys] or DEFAULT_MODAL_KEYS
+    table = {}
+    for action, key, ctrl, shift, alt in keys:
+        if action == 'CONFIRM':
+            # shift and alt are confirm options
+            for options in ((True, False), (False, True), (True, True)):
+                table.setdefault((key, ctrl, shift or options[0], alt or options[1]), action)
+        table[(key, ctrl, shift, alt)] = action
+    return table
+
+## events passed to the viewport while an async apply is running
+NAVIGATION_EVENTS = {'MOUSEMOVE', 'INBETWEEN_MOUSEMOVE', 'MIDDLEMOUSE', 'WHEELUPMOUSE', 'WHEELDOWNMOUSE',
+    'TRACKPADPAN', 'TRACKPADZOOM', 'NDOF_MOTION', 'TIMER'}
 
 class BOXD_OT_lattice_gp_deform(bpy.types.Operator):
     """Create a lattice to use as transform"""
@@ -309,156 +1785,194 @@ class BOXD_OT_lattice_gp_deform(bpy.types.Operator):
 
     # local variable
     tab_press_ct = 0
+    job = None# AsyncApply running after confirm
+    header_state = None
 
     def modal(self, context, event):
-        display_text = f"Deform Cage size: {self.lat.points_u}x{self.lat.points_v} (1-9 or ctrl + ←→↑↓])  | \
-mode (M) : {'Linear' if self.lat.interpolation_type_u == 'KEY_LINEAR' else 'Spline'} | \
-valid:Spacebar/Enter/Tab, cancel:Del/Backspace"
-        context.area.header_text_set(display_text)
-        # context.area.tag_redraw() #?
-
-        #tester
-        # if event.type not in {'MOUSEMOVE', 'INBETWEEN_MOUSEMOVE'}: print('key:', event.type, 'value:', event.value)
-
-        ## Handle ctrl+Z
-        if event.type in {'Z'} and event.value == 'PRESS' and event.ctrl:
-            ## Disable (capture key)
-            return {"RUNNING_MODAL"}
-            ## Not found how possible to find modal start point in undo stack to 
-            # print('ops list', context.window_manager.operators.keys())
-            # if context.window_manager.operators:#can be empty
-            #     print('\nlast name', context.window_manager.operators[-1].name)
-
-        # auto interpo
+        # most frequent events (dragging cage points), pass them right away
+        if event.type in {'MOUSEMOVE', 'INBETWEEN_MOUSEMOVE'}:
+            return {'PASS_THROUGH'}
+        with self.timer.phase('modal'):
+            ret = self.modal_event(context, event)
+        if ret & {'FINISHED', 'CANCELLED'}:
+            self.timer.record('CANCELLED' if 'CANCELLED' in ret else 'FINISHED')
+        return ret
+
+    def modal_event(self, context, event):
+        if self.job is not None:
+            return self.async_event(context, event)
+
+        # store cage state after each action (drag release, transform end, key...)
+        if event.type != 'TIMER':
+            self.session.checkpoint()
+
+        action = self.keys.get((event.type, event.ctrl, event.shift, event.alt)) if event.value == 'PRESS' else None
+        if action is None:
+            ret = {'PASS_THROUGH'}
+        else:
+            _label, method, args = MODAL_ACTIONS[action]
+            ret = getattr(self, method)(context, event, *args)
+
+        if ret & {'RUNNING_MODAL', 'PASS_THROUGH'}:
+            self.update_header(context)
+        return ret
+
+    def update_header(self, context):
+        # rebuild header text only when what it display changed
+        state = (self.lat.points_u, self.lat.points_v, self.lat.interpolation_type_u, self.session.lod_step)
+        if state == self.header_state:
+            return
+        self.header_state = state
+        preview = f"Preview 1/{state[3]} points | " if state[3] > 1 else ''
+        context.area.header_text_set(f"{preview}Deform Cage size: {state[0]}x{state[1]} (1-9 or ctrl + ←→↑↓])  | \
+mode (M) : {'Linear' if state[2] == 'KEY_LINEAR' else 'Spline'} | \
+undo/redo: ctrl(+shift)+Z | valid:Spacebar/Enter/Tab (+shift: all frames in range, +alt: toggle reproject), cancel:Del/Backspace")
+
+    ## --- modal actions (bound to keys in MODAL_ACTIONS)
+
+    def undo_cage(self, context, event):
+        ## blender undo would step in lattice edit undo stack : walk cage history instead
+        self.session.undo()
+        return {"RUNNING_MODAL"}
+
+    def redo_cage(self, context, event):
+        self.session.redo()
+        return {"RUNNING_MODAL"}
+
+    def no_hide(self, context, event):
+        self.report({'INFO'}, "Don't try to hide it ! it's no use ! ahah ;)")
+        return {"RUNNING_MODAL"}
+
+    def set_resolution(self, context, event, u, v):
         if self.auto_interp:
-            if event.type in {'TWO', 'THREE', 'FOUR', 'FIVE', 'SIX', 'SEVEN', 'EIGHT', 'NINE', 'ZERO',} and event.value == 'PRESS':
-                self.set_lattice_interp('KEY_BSPLINE')
-            if event.type in {'DOWN_ARROW', "UP_ARROW", "RIGHT_ARROW", "LEFT_ARROW"} and event.value == 'PRESS' and event.ctrl:
-                # not after actual change, can't check "self.lat.points_u == self.lat.points_v == 2"
-                self.set_lattice_interp('KEY_BSPLINE')
-            if event.type in {'ONE'} and event.value == 'PRESS':
-                self.set_lattice_interp('KEY_LINEAR')
-
-        # Single keys
-        if event.type in {'H'}:
-            if event.value == 'PRESS':
-                self.report({'INFO'}, "Don't try to hide it ! it's no use ! ahah ;)")
-                # print("Don't try to hide it ! it's no use ! ahaha")
-                return {"RUNNING_MODAL"}
-        
-        if event.type in {'ONE'} and event.value == 'PRESS':# , 'NUMPAD_1'
-            self.lat.points_u = self.lat.points_v = 2
-            return {"RUNNING_MODAL"}
-
-        if event.type in {'TWO'} and event.value == 'PRESS':# , 'NUMPAD_2'
-            self.lat.points_u = self.lat.points_v = 3
-            return {"RUNNING_MODAL"}
-
-        if event.type in {'THREE'} and event.value == 'PRESS':# , 'NUMPAD_3'
-            self.lat.points_u = self.lat.points_v = 4
-            return {"RUNNING_MODAL"}
-
-        if event.type in {'FOUR'} and event.value == 'PRESS':# , 'NUMPAD_4'
-            self.lat.points_u = self.lat.points_v = 5
-            return {"RUNNING_MODAL"}
-
-        if event.type in {'FIVE'} and event.value == 'PRESS':# , 'NUMPAD_5'
-            self.lat.points_u = self.lat.points_v = 6
-            return {"RUNNING_MODAL"}
-
-        if event.type in {'SIX'} and event.value == 'PRESS':# , 'NUMPAD_6'
-            self.lat.points_u = self.lat.points_v = 7
-            return {"RUNNING_MODAL"}
-
-        if event.type in {'SEVEN'} and event.value == 'PRESS':# , 'NUMPAD_7'
-            self.lat.points_u = self.lat.points_v = 8
-            return {"RUNNING_MODAL"}
-
-        if event.type in {'EIGHT'} and event.value == 'PRESS':# , 'NUMPAD_8'
-            self.lat.points_u = self.lat.points_v = 9
-            return {"RUNNING_MODAL"}
-
-        if event.type in {'NINE'} and event.value == 'PRESS':# , 'NUMPAD_9'
-            self.lat.points_u = self.lat.points_v = 10
-            return {"RUNNING_MODAL"}
-
-        if event.type in {'ZERO'} and event.value == 'PRESS':# , 'NUMPAD_0'
-            self.lat.points_u = 2
-            self.lat.points_v = 1
-            return {"RUNNING_MODAL"}
-        
-        if event.type in {'RIGHT_ARROW'} and event.value == 'PRESS' and event.ctrl:
-            if self.lat.points_u < 20:
-                self.lat.points_u += 1 
-            return {"RUNNING_MODAL"}
-
-        if event.type in {'LEFT_ARROW'} and event.value == 'PRESS' and event.ctrl:
-            if self.lat.points_u > 1:
-                self.lat.points_u -= 1 
-            return {"RUNNING_MODAL"}
-
-        if event.type in {'UP_ARROW'} and event.value == 'PRESS' and event.ctrl:
-            if self.lat.points_v < 20:
-                self.lat.points_v += 1 
-            return {"RUNNING_MODAL"}
-
-        if event.type in {'DOWN_ARROW'} and event.value == 'PRESS' and event.ctrl:
-            if self.lat.points_v > 1:
-                self.lat.points_v -= 1 
-            return {"RUNNING_MODAL"}
+            # weights are rebuilt by the resolution change just below
+            self.set_lattice_interp('KEY_LINEAR' if (u, v) == (2, 2) else 'KEY_BSPLINE', refresh=False)
+        self.lat.points_u = u
+        self.lat.points_v = v
+        self.rebuild_weights()
+        return {"RUNNING_MODAL"}
+
+    def step_resolution(self, context, event, du, dv):
+        if self.auto_interp:
+            # not after actual change, can't check "self.lat.points_u == self.lat.points_v == 2"
+            self.set_lattice_interp('KEY_BSPLINE', refresh=False)
+        u, v = self.lat.points_u + du, self.lat.points_v + dv
+        if 1 <= u <= 20 and 1 <= v <= 20:
+            self.lat.points_u = u
+            self.lat.points_v = v
+            self.rebuild_weights()
+        return {"RUNNING_MODAL"}
+
+    def toggle_interp(self, context, event):
+        self.auto_interp = self.session.auto_interp = False
+        interp = 'KEY_BSPLINE' if self.lat.interpolation_type_u == 'KEY_LINEAR' else 'KEY_LINEAR'
+        self.set_lattice_interp(interp)
+        return {"RUNNING_MODAL"}
+
+    def confirm(self, context, event):
+        #bpy.ops.ed.flush_edits()# TODO: find a way to get rid of undo-registered lattices tweaks
+        reproject = None
+        if self.prefs.use_reproject != event.alt:
+            # get drawing planes while still in lattice edit view (view may change during background apply)
+            r3d = context.space_data.region_3d
+            reproject = {obj.name: drawing_plane(obj, context.scene, r3d) for obj in self.gp_objs}
+        self.restore_prefs(context)
+        with self.timer.phase('mode_switch'):
+            back_to_obj(self.gp_objs, self.gp_mode, self.org_lattice_toolset, context)
+        if self.prefs.use_async_apply:
+            # bake from timers, modal keep running to wait for it and catch cancel
+            self.job = AsyncApply(self.session, get_frame_range(context.scene) if event.shift else None,
+                reproject=reproject, budget_ms=self.prefs.async_budget, area=context.area)
+            self.job.start()
+            self.wake_timer = context.window_manager.event_timer_add(0.1, window=context.window)
+            return {'RUNNING_MODAL'}
 
-        # change modes
-        if event.type in {'M'} and event.value == 'PRESS':
-            self.auto_interp = False
-            interp = 'KEY_BSPLINE' if self.lat.interpolation_type_u == 'KEY_LINEAR' else 'KEY_LINEAR'
-            self.set_lattice_interp(interp)
+        if event.shift:
+            # propagate to all frames of deformed layers in scene range
+            wm = context.window_manager
+            wm.progress_begin(0, 100)
+            point_ct, frame_ct = apply_cage(self.session, get_frame_range(context.scene),
+                progress=lambda done, total: wm.progress_update(int(100 * done / total)),
+                reproject=reproject)
+            wm.progress_end()
+        else:
+            point_ct, frame_ct = apply_cage(self.session, reproject=reproject)
+        return self.finish(context, point_ct, frame_ct)
+
+    def tab_cancel(self, context, event):
+        # One Warning for Tab cancellation.
+        self.tab_press_ct += 1
+        if self.tab_press_ct < 2:
+            self.report({'WARNING'}, "Pressing TAB again will Cancel")
             return {"RUNNING_MODAL"}
-
-        # Valid
-        if event.type in {'RET', 'SPACE'}:
-            if event.value == 'PRESS':
-                #bpy.ops.ed.flush_edits()# TODO: find a way to get rid of undo-registered lattices tweaks
-                self.restore_prefs(context)
-                back_to_obj(self.gp_obj, self.gp_mode, self.org_lattice_toolset, context)
-                apply_cage(self.gp_obj, self.cage)#must be in object mode
-                
-                # back to original mode 
+        return self.cancel_modal(context, event)
+
+    def cancel_modal(self, context, event):
+        self.cancel(context)
+        return {'CANCELLED'}
+
+    def finish(self, context, point_ct, frame_ct):
+        # record only applied deformations (hidden cage still hold them)
+        if self.prefs.record_dir:
+            with self.timer.phase('record'):
+                try:
+                    save_record(bpy.path.abspath(self.prefs.record_dir), self.cage)
+                except OSError as e:
+                    # deformation is applied anyway
+                    self.report({'WARNING'}, f'Box deform: cannot save record: {e}')
+        self.report({'INFO'}, f'Deformed {point_ct} points on {frame_ct} frame(s)')
+
+        # back to original mode 
+        if self.gp_mode != 'OBJECT':
+            with self.timer.phase('mode_switch'):
+                bpy.ops.object.mode_set(mode=self.gp_mode)
+
+        context.area.header_text_set(None)#reset header
+        return {'FINISHED'}
+
+    def async_event(self, context, event):
+        # deformation is baked from timers, only wait for the end or a cancel
+        if self.job.done or event.type in {'ESC', 'DEL', 'BACK_SPACE'} and event.value == 'PRESS':
+            context.window_manager.event_timer_remove(self.wake_timer)
+            job, self.job = self.job, None
+            if not job.done or job.error:
+                if job.error:
+                    self.report({'ERROR'}, f'Box deform apply failed: {job.error}')
+                else:
+                    job.cancel()
+                    self.report({'WARNING'}, 'Box deform apply cancelled, points restored')
                 if self.gp_mode != 'OBJECT':
                     bpy.ops.object.mode_set(mode=self.gp_mode)
+                context.area.header_text_set(None)
+                return {'CANCELLED'}
+            self.timer.count(points=job.point_ct, frames=job.frame_ct)
+            return self.finish(context, job.point_ct, job.frame_ct)
 
-                context.area.header_text_set(None)#reset header
-
-                return {'FINISHED'}
-        
-        # Abort ---
-        # One Warning for Tab cancellation.
-        if event.type == 'TAB' and event.value == 'PRESS':
-            self.tab_press_ct += 1
-            if self.tab_press_ct < 2:
-                self.report({'WARNING'}, "Pressing TAB again will Cancel")
-                return {"RUNNING_MODAL"}
-
-        if event.type in {'T'} and event.value == 'PRESS' and event.ctrl:
-            # Retyped same shortcut...
-            self.cancel(context)
-            return {'CANCELLED'}
-
-        if event.type in {'DEL', 'BACK_SPACE'} or self.tab_press_ct >= 2:#'ESC',
-            self.cancel(context)
-            return {'CANCELLED'}
-
-        return {'PASS_THROUGH'}
+        if event.type in NAVIGATION_EVENTS:
+            return {'PASS_THROUGH'}
+        return {'RUNNING_MODAL'}
 
-    def set_lattice_interp(self, interp):
+    def set_lattice_interp(self, interp, refresh=True):
+        if self.lat.interpolation_type_u == interp:
+            return
         self.lat.interpolation_type_u = self.lat.interpolation_type_v = self.lat.interpolation_type_w = interp
+        if refresh:
+            self.rebuild_weights()
+
+    def rebuild_weights(self):
+        # cage resolution or interpolation changed : recompute weight matrix and refresh points
+        self.session.rebuild()
+        self.session.update(force=True)
 
     def cancel(self, context):
         self.restore_prefs(context)
-        back_to_obj(self.gp_obj, self.gp_mode, self.org_lattice_toolset, context)
-        cancel_cage(self.gp_obj, self.cage)
+        with self.timer.phase('mode_switch'):
+            back_to_obj(self.gp_objs, self.gp_mode, self.org_lattice_toolset, context)
+        cancel_cage(self.session)
         context.area.header_text_set(None)     
         if self.gp_mode != 'OBJECT':
-            bpy.ops.object.mode_set(mode=self.gp_mode)
+            with self.timer.phase('mode_switch'):
+                bpy.ops.object.mode_set(mode=self.gp_mode)
 
     def store_prefs(self, context):
         # store_valierables <-< preferences
@@ -491,22 +2005,35 @@ valid:Spacebar/Enter/Tab, cancel:Del/Backspace"
             return {'CANCELLED'}
 
         self.prefs = get_addon_prefs()#get_prefs
+        self.timer = PhaseTimer(self.prefs.use_timing)
         self.org_lattice_toolset = None
         self.gp_mode = 'EDIT_GPENCIL'
 
         # --- special Case of lattice revive modal, just after ctrl+Z back into lattice with modal stopped
-        if context.mode == 'EDIT_LATTICE' and context.object.name == 'lattice_cage_deform' and len(context.object.vertex_groups):
-            self.gp_obj = context.scene.objects.get(context.object.vertex_groups[0].name)
-            if not self.gp_obj:
+        if context.mode == 'EDIT_LATTICE' and context.object.name == CAGE_NAME and len(context.object.vertex_groups):
+            self.gp_objs = [context.scene.objects.get(vg.name) for vg in context.object.vertex_groups]
+            if not all(self.gp_objs):
                 self.report({'ERROR'}, "/!\\ Box Deform : Cannot find object to target")
                 return {'CANCELLED'}
-            if not self.gp_obj.grease_pencil_modifiers.get('tmp_lattice'):
-                self.report({'ERROR'}, "/!\\ No 'tmp_lattice' modifiers on GP object")
+            self.gp_obj = self.gp_objs[0]
+            # references are invalid after undo, get points again from stored indices
+            self.session = revive_cache.get(revive_key(context.object.name, [o.name for o in self.gp_objs]))
+            if not self.session or not self.session.relink(self.gp_objs, context.object):
+                self.report({'ERROR'}, "/!\\ Box Deform : Cannot find deformed points to revive modal")
                 return {'CANCELLED'}
             self.cage = context.object
             self.lat = self.cage.data
+            self.auto_interp = self.prefs.auto_swap_deform_type if self.session.auto_interp is None else self.session.auto_interp
+            self.keys = modal_key_table(self.prefs)
+            self.store_prefs(context)
             self.set_prefs(context)
+            self.update_header(context)
 
+            # undo restored original points, show current cage deformation again
+            self.session.timer = self.timer
+            self.session.set_lod(preview_step(self.session.point_count, preview_budget(self.prefs)))
+            self.session.update(force=True)
+            start_live_deform(self.session)
             context.window_manager.modal_handler_add(self)
             return {'RUNNING_MODAL'}
 
@@ -525,55 +2052,213 @@ valid:Spacebar/Enter/Tab, cancel:Del/Backspace"
         # https://developer.blender.org/D6147 <- undo forget 
 
         self.gp_obj = context.object
+        self.gp_objs = [self.gp_obj]
+        if context.mode == 'OBJECT':
+            # all selected GP objects share the cage (edit and paint only work on the active object)
+            self.gp_objs += [o for o in context.selected_objects if o.type == 'GPENCIL' and o != self.gp_obj]
+
         # Clean potential failed previous job (delete tmp lattice)
-        mod = self.gp_obj.grease_pencil_modifiers.get('tmp_lattice')
-        if mod:
-            print('Deleted remaining lattice modifiers')
-            self.gp_obj.grease_pencil_modifiers.remove(mod)
-
-        phantom_obj = context.scene.objects.get('lattice_cage_deform')
-        if phantom_obj:
-            print('deleted remaining lattice object')
-            delete_cage(phantom_obj)
-
-        if [m for m in self.gp_obj.grease_pencil_modifiers if m.type == 'GP_LATTICE']:
-            self.report({'ERROR'}, "Beg your pardon, but your object already has a lattice modifier (it happens that GP object can only have one lattice modifiers).\nDevotely yours, Alfred.")#maybe not paint for now
-            return {'CANCELLED'}
-        
+        for obj in self.gp_objs:
+            clean_legacy_data(obj)
+
 
         self.gp_mode = context.mode#store mode for restore
         
         # All good, create lattice and start modal
 
         # Create lattice (and switch to lattice edit) ----
-        self.cage = view_cage(self.gp_obj)
-        if isinstance(self.cage, str):#error, cage not created, display error
-            self.report({'ERROR'}, self.cage)
+        with self.timer.phase('invoke'):
+            self.session = view_cage(self.gp_objs, timer=self.timer)
+        if isinstance(self.session, str):#error, cage not created, display error
+            self.report({'ERROR'}, self.session)
             return {'CANCELLED'}
-        
+
+        self.cage = self.session.cage
+        # gp_objs keep all GP objects selected at invoke (active first) to restore the selection,
+        # even those left out of the session for lack of points
+
         self.lat = self.cage.data
 
         ## usability toggles
         if self.prefs.use_clic_drag:#Store the active tool since we will change it
             self.org_lattice_toolset = bpy.context.workspace.tools.from_space_view3d_mode(bpy.context.mode, create=False).idname# Tweaktoolcode    
         
-        self.auto_interp = self.prefs.auto_swap_deform_type
+        self.auto_interp = self.session.auto_interp = self.prefs.auto_swap_deform_type
+        self.keys = modal_key_table(self.prefs)
         #store (scene properties needed in case of ctrlZ revival)
         self.store_prefs(context)
         self.set_prefs(context)
+        self.update_header(context)
+        start_live_deform(self.session)
         context.window_manager.modal_handler_add(self)
         return {'RUNNING_MODAL'}
 
 
+SELECT_MODE_ITEMS = (
+    ('ALL', "All", "All points of the active frame of each layer (like object mode)"),
+    ('SELECTED', "Selected", "Selected points of the active frames, or selected frames in multiframe (like edit mode)"),
+    ('LAST_STROKE', "Last stroke", "Last stroke of the active layer (like paint mode)"),
+    )
+
+class BOXD_PGT_control_point(bpy.types.PropertyGroup):
+    co : bpy.props.FloatVectorProperty(
+        name='Offset', description='Control point displacement in cage space', size=3)
+
+class BOXD_OT_box_deform_apply(bpy.types.Operator):
+    """Apply a box deformation on grease pencil points in one call
+    Need no viewport, usable from scripts and in background"""
+    bl_idname = "gp.box_deform_apply"
+    bl_label = "Box deform apply"
+    bl_description = "Deform grease pencil points with a box cage defined by control points offsets"
+    bl_options = {"REGISTER", "UNDO"}
+
+    target : bpy.props.StringProperty(
+        name='Target', description='Name of the grease pencil object to deform (active object if empty)')
+
+    select_mode : bpy.props.EnumProperty(items=SELECT_MODE_ITEMS,
+               name='Points', default='ALL', description='Points to deform')
+
+    points_u : bpy.props.IntProperty(name='Points U', default=2, min=1, max=64)
+    points_v : bpy.props.IntProperty(name='Points V', default=2, min=1, max=64)
+
+    interpolation : bpy.props.EnumProperty(
+        items=(('KEY_LINEAR', "Linear", ""),
+               ('KEY_BSPLINE', "Spline", ""),
+               ),
+               name='Interpolation', default='KEY_LINEAR')
+
+    view_source : bpy.props.EnumProperty(
+        items=(('CAMERA', "Camera", "Fit the cage through camera projection"),
+               ('MATRIX', "Matrix", "Fit the cage along axis of passed view matrix"),
+               ('LOCAL', "Local", "Align the cage on object local axis"),
+               ),
+               name='View', default='CAMERA')
+
+    camera : bpy.props.StringProperty(
+        name='Camera', description='Name of the camera object (scene camera if empty)')
+
+    view_matrix : bpy.props.FloatVectorProperty(
+        name='View Matrix', description='World to view matrix', size=16, subtype='MATRIX',
+        default=(1, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1))
+
+    displacement : bpy.props.CollectionProperty(type=BOXD_PGT_control_point,
+        name='Displacement', description='Offset of each control point, ordered along U first (points_u * points_v items)')
+
+    @classmethod
+    def poll(cls, context):
+        return context.scene is not None
+
+    def execute(self, context):
+        obj = context.scene.objects.get(self.target) if self.target else context.object
+        if not obj or obj.type != 'GPENCIL':
+            self.report({'ERROR'}, "No grease pencil object to deform")
+            return {'CANCELLED'}
+
+        camera = view_matrix = None
+        if self.view_source == 'CAMERA':
+            camera = context.scene.objects.get(self.camera) if self.camera else context.scene.camera
+            if not camera or camera.type != 'CAMERA':
+                self.report({'ERROR'}, "No camera found to get view axis")
+                return {'CANCELLED'}
+        elif self.view_source == 'MATRIX':
+            view_matrix = Matrix(self.view_matrix)
+
+        displacement = [cp.co for cp in self.displacement]
+        ct = box_deform_apply(obj, displacement,
+            select_mode=self.select_mode,
+            resolution=(self.points_u, self.points_v),
+            interpolation=self.interpolation,
+            view_matrix=view_matrix,
+            camera=camera)
+
+        if isinstance(ct, str):
+            self.report({'ERROR'}, ct)
+            return {'CANCELLED'}
+
+        self.report({'INFO'}, f'{ct} points deformed')
+        return {'FINISHED'}
+
+class BOXD_OT_box_deform_replay(bpy.types.Operator):
+    """Replay box deform records (saved on confirm) on grease pencil points
+    Pick a record file or a directory to apply all its records in a row"""
+    bl_idname = "gp.box_deform_replay"
+    bl_label = "Box deform replay"
+    bl_description = "Apply saved box deformations on grease pencil points, without modal"
+    bl_options = {"REGISTER", "UNDO"}
+
+    filepath : bpy.props.StringProperty(
+        name='Record', description='Record file, or directory to replay all its records', subtype='FILE_PATH')
+
+    filter_glob : bpy.props.StringProperty(default='*.npy', options={'HIDDEN'})
+
+    target : bpy.props.StringProperty(
+        name='Target', description='Name of the grease pencil object to deform (active object if empty)')
+
+    select_mode : bpy.props.EnumProperty(items=SELECT_MODE_ITEMS,
+               name='Points', default='SELECTED', description='Points to deform')
+
+    placement : bpy.props.EnumProperty(
+        items=(('FIT', "Fit", "Fit the cage on the points, keeping recorded cage orientation"),
+               ('RECORDED', "Recorded", "Use the cage where it was when recorded"),
+               ),
+               name='Placement', default='FIT')
+
+    @classmethod
+    def poll(cls, context):
+        return context.scene is not None
+
+    def invoke(self, context, event):
+        context.window_manager.fileselect_add(self)
+        return {'RUNNING_MODAL'}
+
+    def execute(self, context):
+        obj = context.scene.objects.get(self.target) if self.target else context.object
+        if not obj or obj.type != 'GPENCIL':
+            self.report({'ERROR'}, "No grease pencil object to deform")
+            return {'CANCELLED'}
+
+        files = record_files(bpy.path.abspath(self.filepath))
+        if not files:
+            self.report({'ERROR'}, f"No record found at {self.filepath}")
+            return {'CANCELLED'}
+
+        # check all records before touching points
+        records = [load_record(f) for f in files]
+        errors = [r for r in records if isinstance(r, str)]
+        if errors:
+            self.report({'ERROR'}, errors[0])
+            return {'CANCELLED'}
+
+        for record in records:
+            ct = replay_record(obj, record, select_mode=self.select_mode, placement=self.placement)
+            if isinstance(ct, str):
+                self.report({'ERROR'}, ct)
+                return {'CANCELLED'}
+
+        self.report({'INFO'}, f'{len(records)} record(s) replayed on {ct} points')
+        return {'FINISHED'}
+
+
 ## --- PREFS
 
+class BOXD_PGT_modal_key(bpy.types.PropertyGroup):
+    action : bpy.props.EnumProperty(
+        items=[(k, v[0], '') for k, v in MODAL_ACTIONS.items()], name='Action')
+    type : bpy.props.EnumProperty(
+        items=[(i.identifier, i.name, '', i.value) for i in bpy.types.Event.bl_rna.properties['type'].enum_items],
+        name='Key')
+    ctrl : bpy.props.BoolProperty(name='Ctrl')
+    shift : bpy.props.BoolProperty(name='Shift')
+    alt : bpy.props.BoolProperty(name='Alt')
+
 class BOXD_addon_prefs(bpy.types.AddonPreferences):
     bl_idname = __name__
 
     pref_tabs : bpy.props.EnumProperty(
         items=(('PREF', "Preferences", "Change some preferences of the modal"),
                ('TUTO', "Tutorial", "How to use the tool"),
-               # ('KEYMAP', "Keymap", "customise the default keymap"),
+               ('TIMING', "Timing", "Duration of each phase of last box deform sessions"),
+               ('KEYMAP', "Keymap", "Customise keys used during the modal"),
                ),
                default='PREF')
 
@@ -589,6 +2274,74 @@ class BOXD_addon_prefs(bpy.types.AddonPreferences):
                ),
                name='Starting interpolation', default='KEY_LINEAR', description='Choose default interpolation when entering mode')
 
+    cage_orientation : bpy.props.EnumProperty(
+        items=(('VIEW', "View", "Cage face the view, fitted on projected points", 'HIDE_OFF', 0),
+               ('LOCAL', "Object local axis", "Cage aligned on GP object local axis, facing the drawing plane\nNo anamorphosis when view is not facing the canvas", 'ORIENTATION_LOCAL', 1),
+               ),
+               name='Cage orientation', default='VIEW', description='Choose how the cage is placed when entering mode')
+
+    eval_workers : bpy.props.IntProperty(
+        name='Threads',
+        description="Threads used to compute deformation on confirm and scripted deform\n0 to use all cores",
+        default=0, min=0, max=256)
+
+    eval_chunk_size : bpy.props.IntProperty(
+        name='Chunk size',
+        description="Points computed per chunk (bound temporary memory and split work between threads)\n0 to compute all points at once",
+        default=65536, min=0, soft_min=1024)
+
+    use_lod_preview : bpy.props.BoolProperty(
+        name='Light preview',
+        description="On big selections, only deform a subset of points of each stroke while dragging\n(points in between follow), all points are deformed on confirm",
+        default=True)
+
+    lod_point_budget : bpy.props.IntProperty(
+        name='Preview points',
+        description="Maximum number of points deformed while dragging the cage\nthe subset is chosen from the selection size when entering the box",
+        default=250000, min=1000, soft_max=2000000)
+
+    use_reproject : bpy.props.BoolProperty(
+        name='Reproject on confirm',
+        description="Cast deformed points along the view on the drawing plane (tool settings placement and axis) when confirming\nHold Alt while confirming to do the opposite",
+        default=False)
+
+    use_async_apply : bpy.props.BoolProperty(
+        name='Apply in background',
+        description="Write deformed points by chunks on confirm so the interface stay responsive on big objects\nProgress is shown in header, Esc/Del/Backspace cancel and restore original points",
+        default=False)
+
+    async_budget : bpy.props.IntProperty(
+        name='Time budget (ms)',
+        description="Time spent writing points between two interface refresh",
+        default=20, min=1, max=1000)
+
+    record_dir : bpy.props.StringProperty(
+        name='Records folder',
+        description="Save cage deformation in this folder on each confirm, to replay it later on other strokes (gp.box_deform_replay)\nleave empty to disable",
+        default='', subtype='DIR_PATH')
+
+    modal_keys : bpy.props.CollectionProperty(type=BOXD_PGT_modal_key)
+
+    revive_cache_size : bpy.props.IntProperty(
+        name='Revive memory (MB)',
+        description="Memory kept for sessions that can be revived with ctrl+T after a ctrl+Z back in the box\nOldest sessions are dropped over this limit",
+        default=512, min=0)
+
+    use_timing : bpy.props.BoolProperty(
+        name='Record phases timing',
+        description="Measure duration of each phase of the box deform (gathering, cage fit, live updates, apply...)\nto investigate slow sessions",
+        default=False)
+
+    timing_history : bpy.props.IntProperty(
+        name='Sessions kept',
+        description="Number of last sessions timings kept in memory",
+        default=10, min=1, max=100)
+
+    timing_log : bpy.props.StringProperty(
+        name='Log file',
+        description="Append each session timing to this file (one json per line), leave empty to disable",
+        default='', subtype='FILE_PATH')
+
     auto_swap_deform_type : bpy.props.BoolProperty(
         name='Auto swap interpolation mode',
         description="Automatically set interpolation to 'spline' when subdividing lattice\n Back to 'linear' when",
@@ -612,6 +2365,42 @@ class BOXD_addon_prefs(bpy.types.AddonPreferences):
                 layout.prop(self, "auto_swap_deform_type")
                 layout.label(text="Once 'M' is hit, auto swap is desactivated to stay in your chosen mode", icon='INFO')
 
+                layout.separator()
+                layout.prop(self, "cage_orientation")
+                layout.prop(self, "use_reproject")
+
+                layout.separator()
+                layout.label(text="Deformation of big selections (confirm and scripted deform):")
+                row = layout.row()
+                row.prop(self, "eval_workers")
+                row.prop(self, "eval_chunk_size")
+                row = layout.row()
+                row.prop(self, "use_async_apply")
+                row.prop(self, "async_budget")
+                layout.prop(self, "revive_cache_size")
+                row = layout.row()
+                row.prop(self, "use_lod_preview")
+                row.prop(self, "lod_point_budget")
+
+                layout.separator()
+                layout.prop(self, "record_dir")
+
+            if self.pref_tabs == 'KEYMAP':
+                col = layout.column()
+                if not len(self.modal_keys):
+                    col.label(text="Default keys are used", icon='INFO')
+                    col.operator('gp.box_deform_reset_keys', text='Customize keys', icon='PREFERENCES')
+                else:
+                    for key in self.modal_keys:
+                        row = col.row(align=True)
+                        row.label(text=MODAL_ACTIONS[key.action][0])
+                        row.prop(key, 'ctrl', toggle=True)
+                        row.prop(key, 'shift', toggle=True)
+                        row.prop(key, 'alt', toggle=True)
+                        row.prop(key, 'type', text='', event=True)
+                    col.separator()
+                    col.operator('gp.box_deform_reset_keys', text='Restore default keys', icon='LOOP_BACK')
+
             if self.pref_tabs == 'TUTO':
 
                 #**Behavior from context mode**
@@ -619,19 +2408,23 @@ class BOXD_addon_prefs(bpy.types.AddonPreferences):
                 col.label(text="Usage:", icon='MOD_LATTICE')
                 col.label(text="Use the shortcut 'Ctrl+T' in available modes (listed below)")
                 col.label(text="The lattice box is generated facing your view (be sure to face canvas if you want to stay on it)")
+                col.label(text="or aligned on object local axis if 'Cage orientation' is set to local in preferences")
                 col.label(text="Use shortcuts below to deform(a help will be displayed in the topbar)")
 
                 col.separator()
                 col.label(text="Shortcuts:", icon='HAND')
                 col.label(text="Spacebar / Enter : Confirm")
+                col.label(text="Shift + Spacebar / Enter : Confirm and apply same deformation on all frames of the layers in scene range")
+                col.label(text="Alt + Spacebar / Enter : Confirm and reproject points on drawing plane (inverted if 'Reproject on confirm' is enabled)")
                 col.label(text="Delete / Backspace / Tab(twice) / ctrl+T : Cancel")
+                col.label(text="Ctrl + Z / Ctrl + Shift + Z : Undo / Redo cage changes during modal")
                 col.label(text="M : Toggle between Linear and Spline mode at any moment")
                 col.label(text="1-9 top row number : Subdivide the box")
                 col.label(text="Ctrl + arrows-keys : Subdivide the box incrementally in individual X/Y axis")
 
                 col.separator()
                 col.label(text="Modes and deformation target:", icon='PIVOT_BOUNDBOX')
-                col.label(text="- Object mode : The whole GP object is deformed")
+                col.label(text="- Object mode : The whole GP object is deformed (all selected GP objects share the same box)")
                 col.label(text="- GPencil Edit mode : Deform Selected points")
                 col.label(text="- Gpencil Paint : Deform last Strokes")
                 # col.label(text="- Lattice edit : Revive the modal after a ctrl+Z")
@@ -644,15 +2437,66 @@ class BOXD_addon_prefs(bpy.types.AddonPreferences):
 
                 #col.operator("wm.url_open", text="Demo").url = "DEMO URL"
 
+            if self.pref_tabs == 'TIMING':
+                layout.prop(self, "use_timing")
+                col = layout.column()
+                col.active = self.use_timing
+                col.prop(self, "timing_history")
+                col.prop(self, "timing_log")
+
+                layout.separator()
+                if not timings:
+                    layout.label(text='No session recorded', icon='INFO')
+                for rec in reversed(timings):
+                    box = layout.box()
+                    counts = ', '.join(f'{k}: {v}' for k, v in rec['counts'].items())
+                    box.label(text=f"{rec['date']} - {rec['result'].lower()} - {counts}", icon='TIME')
+                    flow = box.grid_flow(columns=3, even_columns=True)
+                    for phase, sec in rec['phases'].items():
+                        flow.label(text=f'{phase}: {sec * 1000:.1f} ms')
+                if timings:
+                    layout.operator('gp.box_deform_clear_timings', icon='TRASH')
+
 
 
 def get_addon_prefs():
-    import os
     addon_name = os.path.splitext(__name__)[0]
     preferences = bpy.context.preferences
     addon_prefs = preferences.addons[addon_name].preferences
     return (addon_prefs)
 
+def get_addon_prefs_or_none():
+    '''Addon preferences, None when module is loaded without being registered as addon (benchmark)'''
+    try:
+        return get_addon_prefs()
+    except KeyError:
+        return None
+
+class BOXD_OT_reset_keys(bpy.types.Operator):
+    bl_idname = "gp.box_deform_reset_keys"
+    bl_label = "Reset box deform keys"
+    bl_description = "Set modal keys to default (editable afterward)"
+    bl_options = {"REGISTER", "INTERNAL"}
+
+    def execute(self, context):
+        keys = get_addon_prefs().modal_keys
+        keys.clear()
+        for action, key_type, ctrl, shift, alt in DEFAULT_MODAL_KEYS:
+            key = keys.add()
+            key.action, key.type, key.ctrl, key.shift, key.alt = action, key_type, ctrl, shift, alt
+        context.preferences.is_dirty = True
+        return {'FINISHED'}
+
+class BOXD_OT_clear_timings(bpy.types.Operator):
+    bl_idname = "gp.box_deform_clear_timings"
+    bl_label = "Clear timings"
+    bl_description = "Clear recorded box deform sessions timings"
+    bl_options = {"REGISTER", "INTERNAL"}
+
+    def execute(self, context):
+        timings.clear()
+        return {'FINISHED'}
+
 ## --- KEYMAP
 
 addon_keymaps = []
@@ -684,22 +2528,44 @@ def unregister_keymaps():
 
 ### --- REGISTER ---
 
+CACHE_HANDLERS = (
+    ('depsgraph_update_post', gather_cache_depsgraph_update),
+    ('undo_post', gather_cache_clear),
+    ('redo_post', gather_cache_clear),
+    ('load_post', gather_cache_clear),
+    ('load_post', revive_cache_clear),
+)
+
 classes = (
+BOXD_PGT_modal_key,
 BOXD_addon_prefs,
+BOXD_PGT_control_point,
 BOXD_OT_lattice_gp_deform,
+BOXD_OT_box_deform_apply,
+BOXD_OT_box_deform_replay,
+BOXD_OT_reset_keys,
+BOXD_OT_clear_timings,
 )
 
 def register():
-    if bpy.app.background:
-        return
     for cls in classes:
         bpy.utils.register_class(cls)
+    for handlers, func in CACHE_HANDLERS:
+        getattr(bpy.app.handlers, handlers).append(func)
+    # background : only the scriptable apply operator is usable
+    if bpy.app.background:
+        return
     register_keymaps()
 
 def unregister():
-    if bpy.app.background:
-        return
-    unregister_keymaps()
+    stop_live_deform()
+    for handlers, func in CACHE_HANDLERS:
+        if func in getattr(bpy.app.handlers, handlers):
+            getattr(bpy.app.handlers, handlers).remove(func)
+    gather_cache.clear()
+    revive_cache.clear()
+    if not bpy.app.background:
+        unregister_keymaps()
     for cls in reversed(classes):
         bpy.utils.unregister_class(cls)
 
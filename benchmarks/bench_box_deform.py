@@ -0,0 +1,178 @@
+'''Box deform benchmark on synthetic grease pencil data
+
+Run in a background blender session:
+    blender --background --factory-startup --python benchmarks/bench_box_deform.py -- --output bench.json
+
+Each combination of the swept parameters build a new GP object, then time
+every phase of the box deform with the addon functions used by view_cage,
+apply_cage and cancel_cage (only the view and mode switch are left out).
+Results are written as JSON or CSV (from output extension).
+'''
+
+import sys
+import os
+import time
+import json
+import csv
+import argparse
+import itertools
+import importlib.util
+
+import bpy
+import numpy as np
+from mathutils import Matrix
+
+
+def load_addon():
+    '''Import addon module from the repository (no install needed)'''
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '__init__.py')
+    spec = importlib.util.spec_from_file_location('box_deform', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def parse_args():
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+    ints = lambda s: [int(i) for i in s.split(',')]
+    parser = argparse.ArgumentParser(description='Box deform benchmark')
+    parser.add_argument('--strokes', type=ints, default=[10, 100, 1000], help='Strokes per frame (comma separated sweep)')
+    parser.add_argument('--points', type=ints, default=[10, 100], help='Points per stroke')
+    parser.add_argument('--layers', type=ints, default=[1, 4], help='Layer count')
+    parser.add_argument('--frames', type=ints, default=[1], help='Frames per layer (all selected, multiframe edit)')
+    parser.add_argument('--modifiers', type=ints, default=[0, 4], help='Modifier stack depth on GP object')
+    parser.add_argument('--modes', type=lambda s: s.split(','), default=['EDIT_GPENCIL', 'OBJECT'],
+        help='Gather modes (EDIT_GPENCIL : selected points, OBJECT : whole object read lazily)')
+    parser.add_argument('--lod-budget', type=int, default=0, help='Live preview point budget (0 : full resolution)')
+    parser.add_argument('--resolution', type=int, default=4, help='Cage points on U and V')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per combination (best time is kept)')
+    parser.add_argument('--output', default='bench_box_deform.json', help='Result file (.json or .csv)')
+    return parser.parse_args(argv)
+
+
+def build_gp(strokes, points, layers, frames, modifiers):
+    '''Create a GP object with all points and strokes selected'''
+    gp = bpy.data.grease_pencils.new('bench_gp')
+    obj = bpy.data.objects.new('bench_gp', gp)
+    bpy.context.scene.collection.objects.link(obj)
+    gp.use_multiedit = frames > 1
+
+    rng = np.random.default_rng(0)
+    sel = np.ones(points, dtype=bool)
+    # foreach_set does not recalculate stroke geometry (bounds used by object mode fit)
+    update_geometry = bpy.types.GPencilStrokePoints.bl_rna.functions.get('update') is not None# 2.91+
+    for li in range(layers):
+        layer = gp.layers.new(f'layer_{li}')
+        for fi in range(frames):
+            frame = layer.frames.new(fi + 1)
+            frame.select = True
+            for _ in range(strokes):
+                s = frame.strokes.new()
+                s.points.add(points)
+                co = np.zeros((points, 3), dtype=np.float32)
+                co[:, :2] = rng.random(2) * 10 + np.cumsum(rng.normal(scale=0.05, size=(points, 2)), axis=0)
+                s.points.foreach_set('co', co.ravel())
+                s.points.foreach_set('select', sel)
+                s.select = True
+                if update_geometry:
+                    s.points.update()
+
+    for i in range(modifiers):
+        obj.grease_pencil_modifiers.new(f'bench_mod_{i}', 'GP_THICK')
+    return obj
+
+
+def remove_gp(obj):
+    gp = obj.data
+    bpy.data.objects.remove(obj)
+    bpy.data.grease_pencils.remove(gp)
+
+
+class Timer:
+    def __init__(self):
+        self.times = {}
+
+    def __call__(self, phase, func, *args, **kwargs):
+        start = time.perf_counter()
+        ret = func(*args, **kwargs)
+        self.times[phase] = time.perf_counter() - start
+        return ret
+
+
+def run_once(boxd, obj, mode, resolution, lod_budget):
+    '''Time each box deform phase once, return {phase: seconds}'''
+    timer = Timer()
+    scene = bpy.context.scene
+    # front facing orthographic view (same fit as headless API)
+    view_matrix = Matrix.Identity(4)
+
+    # gather cache is only invalidated by the handlers of the registered addon, start cold
+    boxd.gather_cache.clear()
+    all_targets = timer('gather', boxd.gather_all, [obj], mode)
+    timer('gather_cached', boxd.gather_all, [obj], mode)
+    cage_mat = timer('fit_cage', boxd.fit_targets_cage, all_targets, 'VIEW', view_matrix, view_matrix, 2, 2)
+    lod_step = boxd.preview_step(sum(len(t) for t in all_targets), lod_budget)
+
+    def setup_cage():
+        cage = boxd.reset_cage(scene, cage_mat, 'KEY_BSPLINE')
+        cage.data.points_u = cage.data.points_v = resolution
+        return cage
+
+    cage = timer('cage_setup', setup_cage)
+    # object mode targets are read and weighted on first update (part of tweak_update)
+    session = timer('weights', boxd.BoxDeformSession, all_targets, cage, lod_step=lod_step)
+
+    # move a corner then re-evaluate (one interactive tweak)
+    rest, deform = boxd.get_lattice_data(cage.data)
+    deform[0] += (0.1, 0.1, 0.0)
+    cage.data.points.foreach_set('co_deform', deform.ravel())
+    timer('tweak_update', session.update)
+    timer('depsgraph', bpy.context.view_layer.update)
+
+    timer('apply_cage', boxd.apply_cage, session)
+
+    # cancel on a new session (restore original positions), points changed since last gather
+    boxd.gather_cache.clear()
+    session = boxd.BoxDeformSession(boxd.gather_all([obj], mode), setup_cage(), lod_step=lod_step)
+    session.update(force=True)
+    timer('cancel_cage', boxd.cancel_cage, session)
+    return timer.times
+
+
+def write_results(results, path):
+    if path.lower().endswith('.csv'):
+        fields = list(results[0].keys()) if results else []
+        with open(path, 'w', newline='') as fd:
+            writer = csv.DictWriter(fd, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(results)
+    else:
+        with open(path, 'w') as fd:
+            json.dump({'blender': bpy.app.version_string, 'results': results}, fd, indent=2)
+
+
+def main():
+    args = parse_args()
+    boxd = load_addon()
+    results = []
+    for mode, strokes, points, layers, frames, modifiers in itertools.product(
+            args.modes, args.strokes, args.points, args.layers, args.frames, args.modifiers):
+        obj = build_gp(strokes, points, layers, frames, modifiers)
+        runs = [run_once(boxd, obj, mode, args.resolution, args.lod_budget) for _ in range(args.repeat)]
+        remove_gp(obj)
+
+        row = {'mode': mode, 'strokes': strokes, 'points_per_stroke': points, 'layers': layers,
+            'frames': frames, 'modifiers': modifiers,
+            'total_points': strokes * points * layers * frames}
+        # keep best time of each phase (less noise from other processes)
+        for phase in runs[0]:
+            row[phase] = min(run[phase] for run in runs)
+        results.append(row)
+        print(', '.join(f'{k}: {v:.4f}' if isinstance(v, float) else f'{k}: {v}' for k, v in row.items()))
+
+    write_results(results, args.output)
+    print(f'Results written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()